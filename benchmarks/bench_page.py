@@ -0,0 +1,86 @@
+import re
+import sys
+import os
+import json
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.page import Page
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "infoboxes.json")
+
+
+# The per-call regex scan Page used before the parsed index, kept for comparison
+def legacy_links(sidebar):
+    lines = re.split(r"\n\s*\|\s*", sidebar)[1:-1]
+    output = set()
+    for line in lines:
+        output.update(re.findall(r".*?\[\[(.*?)[\|\]]", line))
+    return list(output)
+
+
+def legacy_link_info(sidebar, link):
+    lines = re.split(r"\n\s*\|\s*", sidebar)[1:-1]
+    infos = []
+    for line in lines:
+        try:
+            infos.extend(re.findall(r"(.*?)\s*=.*?\[\[" + link + r"[\|\]]", line))
+        except re.error:
+            pass
+    return infos
+
+
+def load_corpus():
+    with open(FIXTURE, encoding="utf-8") as file:
+        return json.load(file)
+
+
+# Mirrors add_person: list the links once, then label every link
+def run_legacy(corpus):
+    for entry in corpus:
+        for link in legacy_links(entry["sidebar"]):
+            legacy_link_info(entry["sidebar"], link)
+
+
+def run_indexed(corpus):
+    for entry in corpus:
+        page = Page(title=entry["title"], sidebar=entry["sidebar"])
+        for link in page.extract_sidebar_links():
+            page.extract_sidebar_link_info(link)
+
+
+def measure(function, corpus):
+    number, total = timeit.Timer(lambda: function(corpus)).autorange()
+    return total / number
+
+
+def main():
+    corpus = load_corpus()
+    links = sum(len(Page(sidebar=entry["sidebar"]).extract_sidebar_links()) for entry in corpus)
+
+    legacy = measure(run_legacy, corpus)
+    indexed = measure(run_indexed, corpus)
+
+    print("infoboxes: %d, links: %d" % (len(corpus), links))
+    print("legacy regex:  %8.3f ms/corpus" % (legacy * 1000))
+    print("parsed index:  %8.3f ms/corpus" % (indexed * 1000))
+    print("speedup:       %8.1fx" % (legacy / indexed))
+
+    mismatched = []
+    for entry in corpus:
+        page = Page(title=entry["title"], sidebar=entry["sidebar"])
+        for link in page.extract_sidebar_links():
+            if not page.extract_sidebar_link_info(link):
+                continue
+            try:
+                re.compile(r"\[\[" + link + r"[\|\]]")
+                if not legacy_link_info(entry["sidebar"], link):
+                    mismatched.append(link)
+            except re.error:
+                mismatched.append(link)
+    print("links the legacy regex could not label: %d" % len(mismatched))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import requests
+
+FIELDS = ["spouse", "children", "parents", "relatives", "influences", "influenced", "doctoral_advisor", "partner"]
+
+
+# Deterministic stand-in for a recorded crawl: people whose infoboxes link
+# other people, and like real ones more places, organizations, awards and
+# years than people, plus a few redirects
+def synthetic_fixture(people=3000, places=600, organizations=300, awards=50, links=6, seed=1):
+    rng = random.Random(seed)
+    person_titles = ["Person %d" % i for i in range(people)]
+    place_titles = ["Place %d" % i for i in range(places)]
+    organization_titles = ["University %d" % i for i in range(organizations)]
+    award_titles = ["Award %d" % i for i in range(awards)]
+    pages = {}
+
+    for title in person_titles:
+        lines = [
+            "{{Infobox person",
+            "| name = " + title,
+            "| image = " + title + ".jpg",
+            "| birth_date = {{birth date|1900|1|1}}",
+            "| birth_place = [[%s]], [[%s|somewhere]]" % (rng.choice(place_titles), rng.choice(place_titles)),
+            "| death_place = [[%s]], [[%d]]" % (rng.choice(place_titles), rng.randrange(1900, 2000)),
+            "| alma_mater = [[%s]]" % rng.choice(organization_titles),
+            "| employer = [[%s]]" % rng.choice(organization_titles),
+            "| awards = [[%s]], [[%s]]" % tuple(rng.sample(award_titles, 2)),
+        ]
+        targets = rng.sample(person_titles, links)
+        for field in rng.sample(FIELDS, 3):
+            lines.append("| %s = %s" % (field, ", ".join("[[%s]]" % target for target in targets[:2])))
+            targets = targets[2:]
+        lines.append("| occupation = Person")
+        lines.append("}}")
+        pages[title] = {
+            "text": "\n".join(lines) + "\n'''%s''' (1900 - 1990) was a person.\n\n== Life ==\nLong article." % title,
+            "revid": 1000 + len(pages),
+            "extract": "%s (1900 - 1990) was a person. They lived." % title,
+            "image": "https://upload.wikimedia.org/wikipedia/commons/%s.jpg" % title.replace(" ", "_"),
+            "description": "Person (1900-1990)",
+        }
+    for titles, infobox, description in (
+        (place_titles, "settlement", "Town in Nowhere"),
+        (organization_titles, "university", "University in Nowhere"),
+        (award_titles, "award", "Award for something"),
+    ):
+        for title in titles:
+            pages[title] = {
+                "text": "{{Infobox %s\n| name = %s\n| established = 1900\n| motto = Something\n}}\n"
+                "'''%s''' is a %s.\n\n== History ==\nLong article." % (infobox, title, title, infobox),
+                "revid": 1000 + len(pages),
+                "extract": "%s is a %s. %s" % (title, infobox, "It has a long history. " * 10),
+                "image": None,
+                "description": description,
+            }
+
+    redirects = {"P%d" % i: "Person %d" % i for i in range(0, people, 10)}
+    return {"pages": pages, "redirects": redirects}
+
+
+def load_fixture(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_fixture(fixture, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(fixture, file)
+
+
+# Answers the api.php queries Wiki makes (revisions, extracts, pageimages,
+# pageprops, description, info and search) from a fixture. With upstream set
+# it forwards every request there instead and records the pages it sees
+class FixtureServer:
+    extract_batch = 20
+
+    def __init__(self, fixture, latency=0.0, upstream=None):
+        self.fixture = fixture
+        self.latency = latency
+        self.upstream = upstream
+        self.requests = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self, port=0):
+        fixture_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                params = {key: value[0] for key, value in parse_qs(urlsplit(self.path).query).items()}
+                body = json.dumps(fixture_server.respond(params)).encode()
+                with fixture_server.lock:
+                    fixture_server.bytes += len(body)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return "http://127.0.0.1:%d/w/api.php" % self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, params):
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.upstream is not None:
+            data = requests.get(self.upstream, params=params, timeout=30).json()
+            self.record(data)
+            return data
+        if params.get("list") == "search":
+            return self.search(params)
+        return self.query(params)
+
+    def search(self, params):
+        search = params["srsearch"].lower()
+        limit = int(params.get("srlimit", 10))
+        results = [{"title": title} for title in self.fixture["pages"] if search in title.lower()]
+        return {"query": {"search": results[:limit]}}
+
+    def query(self, params):
+        pages = self.fixture["pages"]
+        props = params.get("prop", "").split("|")
+        normalized = []
+        redirects = []
+        titles = []
+
+        for title in params.get("titles", "").split("|"):
+            target = title.replace("_", " ")
+            target = target[:1].upper() + target[1:]
+            if target != title:
+                normalized.append({"from": title, "to": target})
+            if params.get("redirects") and target in self.fixture["redirects"]:
+                redirects.append({"from": target, "to": self.fixture["redirects"][target]})
+                target = self.fixture["redirects"][target]
+            titles.append(target)
+
+        results = {}
+        extract_offset = int(params.get("excontinue", 0))
+        continuation = {}
+        for i, title in enumerate(dict.fromkeys(titles)):
+            if title not in pages:
+                results[str(-1 - i)] = {"ns": 0, "title": title, "missing": ""}
+                continue
+            page = pages[title]
+            result = {"pageid": i + 1, "ns": 0, "title": title}
+            if "revisions" in props:
+                text = page["text"]
+                if params.get("rvsection") == "0":
+                    text = text.split("\n==")[0]
+                result["revisions"] = [{"revid": page["revid"], "slots": {"main": {"*": text}}}]
+            if "extracts" in props:
+                if extract_offset <= i < extract_offset + self.extract_batch:
+                    result["extract"] = page["extract"]
+                elif i >= extract_offset + self.extract_batch:
+                    continuation["excontinue"] = extract_offset + self.extract_batch
+            if "pageimages" in props and page.get("image"):
+                result["thumbnail"] = {"source": page["image"], "width": 500, "height": 500}
+            if "pageprops" in props and page.get("description"):
+                result["pageprops"] = {"wikibase-shortdesc": page["description"]}
+            if "description" in props and page.get("description"):
+                result["description"] = page["description"]
+            if "info" in props:
+                result["lastrevid"] = page["revid"]
+            results[str(i + 1)] = result
+
+        query = {"pages": results}
+        if normalized:
+            query["normalized"] = normalized
+        if redirects:
+            query["redirects"] = redirects
+        data = {"query": query}
+        if continuation:
+            data["continue"] = dict(continuation, **{"continue": "||"})
+        else:
+            data["batchcomplete"] = ""
+        return data
+
+    # Folds the pages of an upstream answer into the fixture
+    def record(self, data):
+        query = data.get("query", {})
+        with self.lock:
+            for redirect in query.get("redirects", []):
+                self.fixture["redirects"][redirect["from"]] = redirect["to"]
+            for result in query.get("pages", {}).values():
+                if "missing" in result or "title" not in result:
+                    continue
+                page = self.fixture["pages"].setdefault(
+                    result["title"], {"text": "", "revid": 0, "extract": "", "image": None, "description": None}
+                )
+                if "revisions" in result:
+                    revision = result["revisions"][0]
+                    page["text"] = revision["slots"]["main"]["*"]
+                    page["revid"] = revision["revid"]
+                if "lastrevid" in result:
+                    page["revid"] = result["lastrevid"]
+                if "extract" in result:
+                    page["extract"] = result["extract"]
+                if "thumbnail" in result:
+                    page["image"] = result["thumbnail"]["source"]
+                if "description" in result:
+                    page["description"] = result["description"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a MediaWiki API stand-in from a page fixture")
+    parser.add_argument("--fixture", help="fixture JSON; a synthetic one is generated when omitted")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--record", metavar="API", help="forward to this api.php and record into --fixture")
+    args = parser.parse_args()
+
+    if args.record and not args.fixture:
+        parser.error("--record needs --fixture to write to")
+    if args.fixture and os.path.exists(args.fixture):
+        fixture = load_fixture(args.fixture)
+    elif args.record:
+        fixture = {"pages": {}, "redirects": {}}
+    else:
+        fixture = synthetic_fixture()
+
+    server = FixtureServer(fixture, latency=args.latency, upstream=args.record)
+    print("serving", server.start(args.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        if args.record:
+            save_fixture(fixture, args.fixture)
+            print("recorded %d pages to %s" % (len(fixture["pages"]), args.fixture), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import sys
+import os
+import gc
+import json
+import time
+import random
+import argparse
+import tracemalloc
+import networkx as nx
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.fixture_server import FixtureServer, synthetic_fixture, load_fixture
+from famous_people_network.wiki import Wiki
+from famous_people_network.page import Page
+from famous_people_network.page_cache import PageCache
+from famous_people_network.people_network import PeopleNetwork
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def cold_network():
+    return PeopleNetwork(wiki=Wiki(cache=PageCache()))
+
+
+def warm_network(seed, depth):
+    network = cold_network()
+    network.add_person(seed, depth)
+    return network
+
+
+# Every benchmark is (name, setup, run): setup builds fresh state outside the
+# measurement and run gets what it returns
+def benchmarks(fixture, seed):
+    people = [title for title in fixture["pages"] if title.startswith("Person")]
+    sidebars = [fixture["pages"][title]["text"] for title in people[:1000]]
+
+    def add_person(depth):
+        return ("add_person depth %d" % depth, cold_network, lambda network: network.add_person(seed, depth - 1))
+
+    def parse_pages(_):
+        for sidebar in sidebars:
+            page = Page(title="", sidebar=sidebar)
+            for link in page.extract_sidebar_links():
+                page.extract_sidebar_link_info(link)
+            page.is_person()
+
+    def layout_setup():
+        network = warm_network(seed, 3)
+        return network
+
+    def cluster_setup():
+        network = warm_network(seed, 3)
+        network.to_ctyoscape()
+        return network
+
+    def remove_setup():
+        network = warm_network(seed, 4)
+        network.add_person("Person 1", 2)
+        network.to_ctyoscape_cluster()
+        return network
+
+    def remove(network):
+        network.remove_person(seed)
+        network.to_ctyoscape_cluster()
+
+    def lod_setup():
+        network = warm_network(seed, 4)
+        network.lod_threshold = 500
+        return network
+
+    return [
+        *[add_person(depth) for depth in range(1, 6)],
+        ("extract_pages 1000", lambda: Wiki(cache=PageCache()), lambda wiki: wiki.extract_pages(people[:1000])),
+        ("page parsing 1000", lambda: None, parse_pages),
+        ("to_ctyoscape depth 4", layout_setup, lambda network: network.to_ctyoscape()),
+        ("cluster_communities depth 4", cluster_setup, lambda network: network.cluster_communities()),
+        ("level of detail depth 5", lod_setup, lambda network: network.to_ctyoscape_cluster()),
+        ("remove_person depth 5", remove_setup, remove),
+    ]
+
+
+# Behavior the optimizations must keep. Each check is (name, function) and
+# returns an error message, or None when it holds
+def checks(fixture, seed):
+    def removed_neighbor_readded_as_seed():
+        network = warm_network(seed, 1)
+        neighbor = next(node for node in network.graph if node != seed)
+        network.remove_person(neighbor)
+        network.add_person(neighbor, 0)
+        network.remove_person(seed)
+        if not network.graph.has_node(neighbor):
+            return "removing %s deleted the seed %s" % (seed, neighbor)
+
+    def removed_neighbor_reexpanded():
+        network = warm_network(seed, 1)
+        neighbor = next(node for node in network.graph if node != seed)
+        network.remove_person(neighbor)
+        network.add_person(seed, 1)
+        network.remove_person(seed)
+        if network.graph.number_of_nodes():
+            return "%d nodes left after removing the only seed" % network.graph.number_of_nodes()
+
+    # The chains connect_people can find: out of the source along infobox
+    # links, across one link in either direction, then against the links back
+    # to the target. Nodes are (person, side)
+    def chain_graph():
+        redirects = fixture.get("redirects", {})
+        people = {}
+        for title, data in fixture["pages"].items():
+            page = Page(title=title, sidebar=data["text"])
+            if page.is_person():
+                people[title] = page
+        chains = nx.DiGraph()
+        for title, page in people.items():
+            for link in page.extract_sidebar_links():
+                neighbor = redirects.get(link, link)
+                if neighbor in people and neighbor != title:
+                    chains.add_edges_from(
+                        [
+                            ((title, 0), (neighbor, 0)),
+                            ((title, 0), (neighbor, 1)),
+                            ((neighbor, 0), (title, 1)),
+                            ((neighbor, 1), (title, 1)),
+                        ]
+                    )
+        return chains
+
+    def shortest_connections():
+        chains = chain_graph()
+        people = sorted({person for person, _ in chains})
+        rng = random.Random(3)
+        network = cold_network()
+        for _ in range(15):
+            source, target = rng.sample(people, 2)
+            expected = nx.shortest_path_length(chains, (source, 0), (target, 1))
+            path = network.connect_people(source, target)
+            found = None if path is None else len(path) - 1
+            if found != expected:
+                return "%s to %s: %s links, shortest is %d" % (source, target, found, expected)
+
+    return [
+        ("remove, re-add as seed, remove first seed", removed_neighbor_readded_as_seed),
+        ("remove, expand again, remove seed", removed_neighbor_reexpanded),
+        ("connect_people finds the shortest chain", shortest_connections),
+    ]
+
+
+def measure(server, setup, run, repeat):
+    seconds = []
+    requests = 0
+    size = 0
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        before = (server.requests, server.bytes)
+        start = time.perf_counter()
+        run(state)
+        seconds.append(time.perf_counter() - start)
+        requests = server.requests - before[0]
+        size = server.bytes - before[1]
+
+    # Peak memory comes from a separate run since tracing slows everything down
+    state = setup()
+    gc.collect()
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": min(seconds), "requests": requests, "kb": size / 1024, "peak_mb": peak / 2**20}
+
+
+# Slower by more than tolerance and by more than floor seconds, which keeps
+# jitter off benchmarks of a few milliseconds, or more requests than the
+# baseline
+def regressions(name, result, baseline, tolerance, floor):
+    if name not in baseline:
+        return []
+    old = baseline[name]
+    found = []
+    if result["seconds"] > max(old["seconds"] * tolerance, old["seconds"] + floor):
+        found.append("time %.3fs -> %.3fs" % (old["seconds"], result["seconds"]))
+    if result["requests"] > old["requests"]:
+        found.append("requests %d -> %d" % (old["requests"], result["requests"]))
+    if "kb" in old and result["kb"] > old["kb"] * tolerance:
+        found.append("transfer %.0fKB -> %.0fKB" % (old["kb"], result["kb"]))
+    if result["peak_mb"] > old["peak_mb"] * tolerance:
+        found.append("memory %.1fMB -> %.1fMB" % (old["peak_mb"], result["peak_mb"]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against a local API stand-in")
+    parser.add_argument("--fixture", help="recorded fixture JSON; a synthetic one is used when omitted")
+    parser.add_argument("--seed", default="Person 0", help="person every expansion starts from")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every API response")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="run benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown before flagging")
+    parser.add_argument("--floor", type=float, default=0.01, help="seconds of slowdown always allowed")
+    args = parser.parse_args()
+
+    fixture = load_fixture(args.fixture) if args.fixture else synthetic_fixture()
+    server = FixtureServer(fixture, latency=args.latency)
+    Wiki.url = server.start()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    flagged = 0
+    for name, check in checks(fixture, args.seed):
+        error = check()
+        if error is not None:
+            print("check failed: %s: %s" % (name, error))
+            flagged += 1
+
+    results = {}
+    print("%-30s %10s %9s %10s %10s" % ("benchmark", "seconds", "requests", "KB", "peak MB"))
+    for name, setup, run in benchmarks(fixture, args.seed):
+        if args.only and args.only not in name:
+            continue
+        result = measure(server, setup, run, args.repeat)
+        results[name] = result
+        found = regressions(name, result, baseline, args.tolerance, args.floor)
+        flagged += bool(found)
+        print(
+            "%-30s %10.3f %9d %10.0f %10.1f  %s"
+            % (name, result["seconds"], result["requests"], result["kb"], result["peak_mb"], "; ".join(found))
+        )
+    server.stop()
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(dict(baseline, **results), file, indent=2, sort_keys=True)
+        print("baseline written to", args.baseline)
+    elif flagged:
+        print("%d regressions against %s" % (flagged, args.baseline))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 import sys
 import os
-from dash import Dash, dcc, html, Input, Output, State, callback
+import uuid
+from urllib.parse import quote
+from dash import Dash, dcc, html, Input, Output, State, Patch, ALL, callback, clientside_callback, ctx, no_update
+from flask import jsonify, request, send_file, abort
+import requests
 from dash.exceptions import PreventUpdate
 import dash_cytoscape as cyto
 from dash_resizable_panels import PanelGroup, Panel, PanelResizeHandle
@@ -8,13 +12,46 @@ from dash_resizable_panels import PanelGroup, Panel, PanelResizeHandle
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from famous_people_network.people_network import PeopleNetwork
+from famous_people_network.page_store import PageStore
+from famous_people_network.jobs import JobManager
+from famous_people_network.wiki import Wiki
+from famous_people_network.page_cache import PageCache
+from famous_people_network.sessions import SessionRegistry
+from famous_people_network.thumbnails import ThumbnailCache
+from famous_people_network.tracing import tracer, merge_timings
 
 
 app = Dash(__name__)
 
-people_network = PeopleNetwork()
+page_store = PageStore(os.path.join(os.path.dirname(__file__), "..", "cache", "pages.db"))
+page_cache = PageCache()
+wiki = Wiki(store=page_store, cache=page_cache)
+wiki.titles.add(page_store.person_titles())
+thumbnails = ThumbnailCache(
+    os.path.join(os.path.dirname(__file__), "..", "cache", "thumbnails"), wiki.fetcher.client
+)
+snapshot_path = os.environ.get("FAMOUS_PEOPLE_SNAPSHOT")
+
+
+# Nodes load their portraits through /thumbnails at the size they are drawn
+def portrait_url(image, size):
+    if not thumbnails.allowed(image, size):
+        return image
+    return app.get_relative_path("/thumbnails/%d?url=%s" % (size, quote(image, safe="")))
+
+
+# New sessions start from the snapshot when one is configured
+def new_network():
+    network = PeopleNetwork(wiki=wiki, portrait_url=portrait_url)
+    if snapshot_path:
+        network.load_snapshot(snapshot_path)
+    return network
 
-app.layout = html.Div(
+
+sessions = SessionRegistry(new_network)
+job_manager = JobManager()
+
+layout = html.Div(
     [
         html.Div(id="none", children=None),
         PanelGroup(
@@ -44,6 +81,12 @@ app.layout = html.Div(
                                                     ),
                                                     "value": "Remove Person",
                                                 },
+                                                {
+                                                    "label": html.Pre(
+                                                        ["Connect People"],
+                                                    ),
+                                                    "value": "Connect People",
+                                                },
                                             ],
                                             value="Add Person",
                                             multi=False,
@@ -73,6 +116,7 @@ app.layout = html.Div(
                                         className="input-default",
                                         value="",
                                         type="text",
+                                        list="person-suggestions",
                                         style={"width": "100%", "padding": "5px"},
                                     ),
                                     style={"flex": 1},
@@ -90,6 +134,20 @@ app.layout = html.Div(
                             ],
                             style={"display": "flex", "flexDirection": "row"},
                         ),
+                        html.Datalist(id="person-suggestions"),
+                        html.Div(
+                            dcc.Input(
+                                id="input-target",
+                                className="input-default",
+                                value="",
+                                type="text",
+                                placeholder="Connect to",
+                                list="person-suggestions",
+                                style={"width": "100%", "padding": "5px"},
+                            ),
+                            id="target-row",
+                            style={"display": "none", "padding": "10px 0 0 0"},
+                        ),
                         html.Div(
                             html.Button(
                                 id="button-submit",
@@ -100,6 +158,7 @@ app.layout = html.Div(
                             ),
                             style={"padding": "20px 0 0 0", "display": "flex"},
                         ),
+                        html.Div(id="job-list", style={"padding": "10px 0 0 0"}),
                         html.Div(
                             id="graph-info",
                             className="container",
@@ -153,6 +212,14 @@ app.layout = html.Div(
                                     "selector": "edge",
                                     "style": {"opacity": 0.3},
                                 },
+                                {
+                                    "selector": "edge[weight]",
+                                    "style": {"width": "mapData(weight, 1, 50, 1, 12)"},
+                                },
+                                {
+                                    "selector": "node[members]",
+                                    "style": {"font-size": "mapData(members, 5, 500, 12, 48)"},
+                                },
                             ],
                         ),
                     ],
@@ -162,11 +229,57 @@ app.layout = html.Div(
         ),
         dcc.Store(id="button-previous", data={"reset": 0, "submit": 0}),
         dcc.Store(id="button-clicked"),
+        dcc.Store(id="graph-version"),
+        dcc.Store(id="jobs", data=[]),
+        dcc.Store(id="timings"),
+        dcc.Store(id="suggest-pending"),
+        dcc.Store(id="suggest-query"),
+        dcc.Interval(id="job-poll", interval=300, disabled=True),
     ],
     style={"height": "100vh"},
 )
 
 
+# Each browser tab keeps the id of its own graph for as long as its session
+# storage lives; the id in a fresh layout is only used the first time
+def serve_layout():
+    return html.Div(
+        layout.children + [dcc.Store(id="session-id", storage_type="session", data=uuid.uuid4().hex)],
+        style=layout.style,
+    )
+
+
+app.layout = serve_layout
+
+
+@app.server.route("/metrics")
+def metrics():
+    return jsonify(
+        {
+            "tracing": tracer.snapshot(),
+            "page_cache": page_cache.stats(),
+            "http": wiki.fetcher.client.stats(),
+            "sessions": len(sessions),
+            "titles": len(wiki.titles),
+        }
+    )
+
+
+# Thumbnails are named after their source, so browsers may keep them for good
+@app.server.route("/thumbnails/<int:size>")
+def thumbnail(size):
+    url = request.args.get("url")
+    if not thumbnails.allowed(url, size):
+        abort(404)
+    try:
+        path = thumbnails.get(url, size)
+    except (requests.RequestException, OSError):
+        abort(502)
+    response = send_file(path, mimetype="image/jpeg", max_age=365 * 24 * 60 * 60)
+    response.cache_control.immutable = True
+    return response
+
+
 @callback(
     Output("button-clicked", "data"),
     Output("button-previous", "data"),
@@ -186,65 +299,273 @@ def button_action(reset, submit, previous):
     return clicked, previous
 
 
+# Add Person runs as a background job; the poll interval renders each level
+# with a provisional layout as it lands, settles the layout once all jobs are
+# done and then stops. Large graphs are drawn as cluster supernodes that
+# expand when clicked or zoomed into, without refitting the view each time
 @callback(
     Output("people-network", "elements"),
+    Output("people-network", "autoRefreshLayout"),
+    Output("graph-version", "data"),
+    Output("jobs", "data"),
+    Output("job-poll", "disabled"),
+    Output("job-list", "children"),
+    Output("timings", "data"),
     Input("button-clicked", "data"),
+    Input("job-poll", "n_intervals"),
+    Input("people-network", "tapNodeData"),
+    Input("people-network", "extent"),
     State("input-person", "value"),
     State("slider-depth", "value"),
     State("dropdown-operation", "value"),
-    running=[
-        (Output("button-submit", "disabled"), True, False),
-        (Output("button-reset", "disabled"), True, False),
-    ],
+    State("input-target", "value"),
+    State("graph-version", "data"),
+    State("jobs", "data"),
+    State("session-id", "data"),
 )
-def update_graph(clicked, person_name, depth, operation):
-    if clicked is None:
+def update_graph(
+    clicked,
+    n_intervals,
+    tapped,
+    extent,
+    person_name,
+    depth,
+    operation,
+    target_name,
+    version,
+    job_ids,
+    session_id,
+):
+    people_network = sessions.get(session_id)
+    before = tracer.snapshot()
+    operation_done = False
+    if "people-network.tapNodeData" in ctx.triggered_prop_ids:
+        if tapped is not None and "cluster" in tapped:
+            people_network.expand_cluster(tapped["cluster"])
+    elif "people-network.extent" in ctx.triggered_prop_ids:
+        people_network.set_viewport(extent)
+    elif ctx.triggered_id == "button-clicked":
+        if clicked is None:
+            raise PreventUpdate
+        if clicked == "reset":
+            for job_id in job_ids:
+                job_manager.cancel(job_id)
+            people_network.reset_graph()
+            operation_done = True
+        elif clicked == "submit":
+            if operation == "Add Person":
+                job = job_manager.submit(
+                    "Add " + person_name, people_network.add_person, person_name, depth - 1
+                )
+                job_ids = job_ids + [job.id]
+            elif operation == "Remove Person":
+                people_network.remove_person(person_name, depth - 1)
+                operation_done = True
+            elif operation == "Connect People":
+                job = job_manager.submit(
+                    "Connect " + person_name + " and " + target_name,
+                    people_network.connect_people,
+                    person_name,
+                    target_name,
+                )
+                job_ids = job_ids + [job.id]
+
+    jobs = [job for job in map(job_manager.get, job_ids) if job is not None]
+    running = [job.id for job in jobs if not job.done()]
+    finished = [job for job in jobs if job.done() and job.timings is not None]
+    if finished and not running:
+        people_network.settle()
+
+    if version == people_network.version:
+        elements = no_update
+    else:
+        with people_network.lock:
+            cytoscape = people_network.to_ctyoscape_cluster(provisional=bool(running))
+            elements = patch_elements(cytoscape, people_network.changes_since(version))
+            version = people_network.version
+
+    # Timings of finished operations including the render that shows them
+    timings = no_update
+    if tracer.enabled and (operation_done or finished):
+        timings = merge_timings(tracer.since(before), *[job.timings for job in finished])
+
+    return (
+        elements,
+        not people_network.lod,
+        version,
+        running,
+        not running,
+        [display_job(job) for job in jobs],
+        timings,
+    )
+
+
+@callback(
+    Output("target-row", "style"),
+    Input("dropdown-operation", "value"),
+    State("target-row", "style"),
+)
+def toggle_target(operation, style):
+    return dict(style, display="block" if operation == "Connect People" else "none")
+
+
+# Suggestions come from the people seen so far without any API traffic. Text
+# nothing matches is left pending for the search API
+@callback(
+    Output("person-suggestions", "children"),
+    Output("suggest-pending", "data"),
+    Input("input-person", "value"),
+    Input("input-target", "value"),
+    prevent_initial_call=True,
+)
+def suggest_people(person_name, target_name):
+    text = (target_name if ctx.triggered_id == "input-target" else person_name) or ""
+    if len(text.strip()) < 2:
+        return [], None
+    titles = wiki.suggest(text)
+    if not titles:
+        return no_update, text
+    return [html.Option(value=title) for title in titles], None
+
+
+# The browser only passes pending text on once typing has paused for 400 ms,
+# so keystrokes that a newer one overtook never reach the server
+clientside_callback(
+    """
+    function (text) {
+        const token = (window.suggestToken || 0) + 1;
+        window.suggestToken = token;
+        if (!text) {
+            return window.dash_clientside.no_update;
+        }
+        return new Promise((resolve) => setTimeout(() => resolve(
+            token === window.suggestToken ? text : window.dash_clientside.no_update
+        ), 400));
+    }
+    """,
+    Output("suggest-query", "data"),
+    Input("suggest-pending", "data"),
+    prevent_initial_call=True,
+)
+
+
+@callback(
+    Output("person-suggestions", "children", allow_duplicate=True),
+    Input("suggest-query", "data"),
+    prevent_initial_call=True,
+)
+def search_people(text):
+    if not text:
+        raise PreventUpdate
+    return [html.Option(value=title) for title in wiki.search_people(text)]
+
+
+def display_job(job):
+    if job.status == "running":
+        status = "level " + str(job.level) + "/" + str(job.depth)
+    elif job.status == "done" and not job.result:
+        status = "not found"
+    else:
+        status = job.status
+
+    children = [html.Span(job.description + ": " + status, style={"flex": 1})]
+    if not job.done():
+        children.append(
+            html.Button(
+                "Cancel",
+                id={"type": "cancel-job", "index": job.id},
+                className="button-default",
+            )
+        )
+    return html.Div(children, style={"display": "flex", "flexDirection": "row", "padding": "2px 0"})
+
+
+@callback(
+    Output("none", "children"),
+    Input({"type": "cancel-job", "index": ALL}, "n_clicks"),
+    prevent_initial_call=True,
+)
+def cancel_job(n_clicks):
+    if not ctx.triggered_id or not any(n_clicks):
         raise PreventUpdate
-    if clicked == "reset":
-        people_network.reset_graph()
-    elif clicked == "submit":
-        if operation == "Add Person":
-            people_network.add_person(person_name, depth - 1)
-        elif operation == "Remove Person":
-            people_network.remove_person(person_name, depth - 1)
+    job_manager.cancel(ctx.triggered_id["index"])
+    return None
+
+
+# Sends only the changed elements when the client is at a version the change
+# log still covers, otherwise the whole element set
+def patch_elements(elements, changes):
+    if changes is None or len(changes) >= len(elements["nodes"]) + len(elements["edges"]):
+        return elements
 
-    return people_network.to_ctyoscape_cluster()
+    patch = Patch()
+    for group, old, new in changes:
+        if old is not None:
+            patch[group].remove(old)
+        if new is not None:
+            patch[group].append(new)
+    return patch
 
 
 @callback(
     Output("graph-info", "children"),
     Input("people-network", "selectedNodeData"),
     Input("people-network", "selectedEdgeData"),
+    Input("timings", "data"),
+    State("session-id", "data"),
 )
-def display_node_page(selected_nodes, selected_edges):
+def display_node_page(selected_nodes, selected_edges, timings, session_id):
+    people_network = sessions.get(session_id)
     output = []
 
-    if selected_nodes:
+    if selected_nodes and "cluster" in selected_nodes[-1]:
+        node = selected_nodes[-1]
+        members = people_network.cluster_members(node["cluster"])
+        output.append(html.H3(node["name"]))
+        output.append(html.P(str(len(members)) + " people, click to expand"))
+        output.append(html.P(", ".join(sorted(members)[:20])))
+
+    elif selected_nodes:
         node = selected_nodes[-1]
         title = node["name"]
         summary = people_network.get_page(title).summary
         output.append(html.H3(title))
         output.append(html.P(summary))
 
+    elif selected_edges and "weight" in selected_edges[-1]:
+        output.append(html.H3("Connection"))
+        output.append(html.P(str(selected_edges[-1]["weight"]) + " links between these clusters"))
+
     elif selected_edges:
         edge = selected_edges[-1]
-        source = people_network.get_page(edge["source"])
-        target = people_network.get_page(edge["target"])
-        source_to_target = source.extract_sidebar_link_info(target)
-        target_to_source = target.extract_sidebar_link_info(source)
+        source, target = edge["source"], edge["target"]
+        source_to_target = people_network.link_labels(source, target)
+        target_to_source = people_network.link_labels(target, source)
 
         output.append(html.H3("Connection"))
         if source_to_target:
-            output.append(
-                html.P(source.title + " (" + ", ".join(source_to_target) + "): " + target.title)
-            )
+            output.append(html.P(source + " (" + ", ".join(source_to_target) + "): " + target))
         if target_to_source:
-            output.append(
-                html.P(target.title + " (" + ", ".join(target_to_source) + "): " + source.title)
-            )
+            output.append(html.P(target + " (" + ", ".join(target_to_source) + "): " + source))
 
+    if timings:
+        output.extend(display_timings(timings))
     return output
 
 
+# Where the time of the last finished operation went, slowest stage first.
+# Stages nest (add_person contains the fetches) and fetches overlap
+def display_timings(timings):
+    spans = sorted(timings["spans"].items(), key=lambda item: -item[1]["seconds"])
+    rows = [
+        html.Tr([html.Td(name), html.Td(str(span["count"])), html.Td("%.3f s" % span["seconds"])])
+        for name, span in spans
+    ]
+    rows.extend(
+        html.Tr([html.Td(name), html.Td(str(value)), html.Td("")]) for name, value in timings["counters"].items()
+    )
+    return [html.H3("Timing"), html.Table(rows, style={"width": "100%", "font-size": "small"})]
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,137 @@
+from collections import Counter, deque
+import networkx as nx
+
+
+# Keeps a node -> cluster id partition across graph updates. New and changed
+# nodes are moved locally; a full Louvain pass only runs when modularity
+# falls too far below what the last full pass reached. Ids of clusters that
+# survive a full pass are kept so their colors stay the same
+class CommunityTracker:
+    def __init__(self, tolerance=0.9, rounds=3, seed=8):
+        self.tolerance = tolerance
+        self.rounds = rounds
+        self.seed = seed
+        self.reset()
+
+    def reset(self):
+        self.partition = {}
+        self.next_id = 0
+        self.version = None
+        self.quality = None
+        self.edges = None
+
+    def update(self, graph, version=None, changed=()):
+        if version is not None and version == self.version:
+            return self.partition
+        self.version = version
+
+        removed = [node for node in self.partition if node not in graph]
+        for node in removed:
+            del self.partition[node]
+        added = [node for node in graph if node not in self.partition]
+        changed = [node for node in changed if node in graph]
+
+        # Nothing changed, as in versions that only change how it is drawn
+        edges = graph.number_of_edges()
+        if self.partition and not added and not removed and not changed and edges == self.edges:
+            return self.partition
+        self.edges = edges
+
+        if not self.partition or len(added) > len(graph) / 2:
+            self._full(graph)
+            return self.partition
+
+        affected = self._assign(graph, added)
+        affected.update(changed)
+        for node in list(affected):
+            affected.update(nx.all_neighbors(graph, node))
+        self._local_moves(graph, affected)
+
+        quality = self._modularity(graph)
+        if self.quality is None or quality < self.quality * self.tolerance:
+            self._full(graph)
+        return self.partition
+
+    def communities(self):
+        clusters = {}
+        for node, cluster in self.partition.items():
+            clusters.setdefault(cluster, set()).add(node)
+        return clusters
+
+    def _full(self, graph):
+        clusters = nx.community.louvain_communities(graph, seed=self.seed)
+        previous = self.partition
+        taken = set()
+        partition = {}
+
+        for cluster in sorted(clusters, key=len, reverse=True):
+            overlap = Counter(previous[node] for node in cluster if node in previous)
+            cluster_id = next((old for old, _ in overlap.most_common() if old not in taken), None)
+            if cluster_id is None:
+                cluster_id = self.next_id
+                self.next_id += 1
+            taken.add(cluster_id)
+            partition.update(dict.fromkeys(cluster, cluster_id))
+
+        self.partition = partition
+        self.quality = self._modularity(graph)
+
+    # Gives new nodes the cluster most of their placed neighbors are in,
+    # spreading breadth-first from nodes that already have one
+    def _assign(self, graph, added):
+        pending = set(added)
+        queue = deque(
+            node for node in added if any(n in self.partition for n in nx.all_neighbors(graph, node))
+        )
+        roots = iter(added)
+        while pending:
+            if queue:
+                node = queue.popleft()
+                if node not in pending:
+                    continue
+                votes = Counter(
+                    self.partition[n] for n in nx.all_neighbors(graph, node) if n in self.partition
+                )
+                self.partition[node] = votes.most_common(1)[0][0]
+            else:
+                node = next(node for node in roots if node in pending)
+                self.partition[node] = self.next_id
+                self.next_id += 1
+            pending.discard(node)
+            queue.extend(n for n in nx.all_neighbors(graph, node) if n in pending)
+        return set(added)
+
+    # Louvain's first phase restricted to the affected nodes
+    def _local_moves(self, graph, nodes):
+        edges = graph.number_of_edges()
+        if not edges:
+            return
+        totals = Counter()
+        for node, degree in graph.degree():
+            totals[self.partition[node]] += degree
+
+        for _ in range(self.rounds):
+            moved = False
+            for node in nodes:
+                current = self.partition[node]
+                degree = graph.degree(node)
+                links = Counter(self.partition[n] for n in nx.all_neighbors(graph, node) if n != node)
+                totals[current] -= degree
+
+                def gain(cluster):
+                    return links[cluster] - totals[cluster] * degree / (2 * edges)
+
+                best = max(links, key=gain, default=current)
+                if gain(best) <= gain(current):
+                    best = current
+                totals[best] += degree
+                if best != current:
+                    self.partition[node] = best
+                    moved = True
+            if not moved:
+                break
+
+    def _modularity(self, graph):
+        if not graph.number_of_edges():
+            return 0
+        return nx.community.modularity(graph, self.communities().values())
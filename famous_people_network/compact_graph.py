@@ -0,0 +1,201 @@
+import sys
+import json
+from array import array
+import numpy as np
+import networkx as nx
+
+
+# Directed graph with interned integer node ids and per-node arrays of
+# neighbor ids. Edge labels are stored as codes of interned tuples of
+# infobox field names. Implements the part of the DiGraph API PeopleNetwork
+# mutates with; algorithms get a networkx copy from to_networkx
+class CompactGraph:
+    def __init__(self):
+        self.titles = []
+        self.ids = {}
+        self.alive = bytearray()
+        self.successors_ = []
+        self.successor_labels = []
+        self.predecessors_ = []
+        self.fields = []
+        self.field_ids = {}
+        self.label_sets = []
+        self.label_set_ids = {}
+        self.node_count = 0
+        self.edge_count = 0
+
+    def is_directed(self):
+        return True
+
+    def __contains__(self, title):
+        return self.has_node(title)
+
+    def __iter__(self):
+        return (title for i, title in enumerate(self.titles) if self.alive[i])
+
+    def __len__(self):
+        return self.node_count
+
+    @property
+    def nodes(self):
+        return list(self)
+
+    def number_of_nodes(self):
+        return self.node_count
+
+    def number_of_edges(self):
+        return self.edge_count
+
+    def has_node(self, title):
+        i = self.ids.get(title)
+        return i is not None and self.alive[i]
+
+    def has_edge(self, source, target):
+        if not self.has_node(source) or not self.has_node(target):
+            return False
+        return self.ids[target] in self.successors_[self.ids[source]]
+
+    def add_node(self, title):
+        i = self.ids.get(title)
+        if i is None:
+            i = len(self.titles)
+            self.ids[title] = i
+            self.titles.append(title)
+            self.alive.append(0)
+            self.successors_.append(array("I"))
+            self.successor_labels.append(array("I"))
+            self.predecessors_.append(array("I"))
+        if not self.alive[i]:
+            self.alive[i] = 1
+            self.node_count += 1
+        return i
+
+    def add_edge(self, source, target, labels="[]"):
+        i = self.add_node(source)
+        j = self.add_node(target)
+        code = self._label_code(labels)
+        successors = self.successors_[i]
+        if j in successors:
+            self.successor_labels[i][successors.index(j)] = code
+            return
+        successors.append(j)
+        self.successor_labels[i].append(code)
+        self.predecessors_[j].append(i)
+        self.edge_count += 1
+
+    def add_edges_from(self, edges):
+        for source, target, *data in edges:
+            labels = data[0].get("labels", "[]") if data else "[]"
+            self.add_edge(source, target, labels)
+
+    def remove_node(self, title):
+        if not self.has_node(title):
+            raise nx.NetworkXError("The node %s is not in the graph." % title)
+        i = self.ids[title]
+        for j in self.successors_[i]:
+            if j != i:
+                self.predecessors_[j].remove(i)
+        for j in self.predecessors_[i]:
+            if j != i:
+                position = self.successors_[j].index(i)
+                del self.successors_[j][position]
+                del self.successor_labels[j][position]
+        self.edge_count -= len(self.successors_[i]) + len(self.predecessors_[i])
+        if i in self.successors_[i]:
+            self.edge_count += 1
+        self.successors_[i] = array("I")
+        self.successor_labels[i] = array("I")
+        self.predecessors_[i] = array("I")
+        self.alive[i] = 0
+        self.node_count -= 1
+
+    def successors(self, title):
+        return iter([self.titles[j] for j in self.successors_[self.ids[title]]])
+
+    neighbors = successors
+
+    def predecessors(self, title):
+        return iter([self.titles[j] for j in self.predecessors_[self.ids[title]]])
+
+    def edge_labels(self, source, target):
+        i = self.ids[source]
+        code = self.successor_labels[i][self.successors_[i].index(self.ids[target])]
+        return [self.fields[field] for field in self.label_sets[code]]
+
+    def _label_code(self, labels):
+        if isinstance(labels, str):
+            labels = json.loads(labels)
+        key = []
+        for field in labels:
+            if field not in self.field_ids:
+                self.field_ids[field] = len(self.fields)
+                self.fields.append(field)
+            key.append(self.field_ids[field])
+        key = tuple(key)
+        if key not in self.label_set_ids:
+            self.label_set_ids[key] = len(self.label_sets)
+            self.label_sets.append(key)
+        return self.label_set_ids[key]
+
+    # Compressed sparse rows over the live node ids: (titles, indptr,
+    # indices, label codes)
+    def to_csr(self):
+        live = [i for i in range(len(self.titles)) if self.alive[i]]
+        position = np.full(len(self.titles), -1, dtype=np.int64)
+        position[live] = np.arange(len(live))
+        indptr = np.zeros(len(live) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(self.successors_[i]) for i in live])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        codes = np.empty(indptr[-1], dtype=np.int32)
+        for row, i in enumerate(live):
+            indices[indptr[row] : indptr[row + 1]] = position[np.frombuffer(self.successors_[i], dtype=np.uint32)]
+            codes[indptr[row] : indptr[row + 1]] = np.frombuffer(self.successor_labels[i], dtype=np.uint32)
+        return [self.titles[i] for i in live], indptr, indices, codes
+
+    def to_networkx(self):
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self)
+        labels = [json.dumps([self.fields[field] for field in key]) for key in self.label_sets]
+        for i, title in enumerate(self.titles):
+            if self.alive[i]:
+                graph.add_edges_from(
+                    (title, self.titles[j], {"labels": labels[code]})
+                    for j, code in zip(self.successors_[i], self.successor_labels[i])
+                )
+        return graph
+
+    def memory_usage(self):
+        return deep_size(
+            [
+                self.titles,
+                self.ids,
+                self.alive,
+                self.successors_,
+                self.successor_labels,
+                self.predecessors_,
+                self.fields,
+                self.field_ids,
+                self.label_sets,
+                self.label_set_ids,
+            ]
+        )
+
+
+def deep_size(value, seen=None):
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__") and not isinstance(value, type):
+        size += deep_size(vars(value), seen)
+    return size
+
+
+def networkx_memory_usage(graph):
+    return deep_size([graph._node, graph._succ, graph._pred, graph.graph])
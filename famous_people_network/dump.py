@@ -0,0 +1,222 @@
+import re
+import sys
+import os
+import bz2
+import json
+import time
+import argparse
+import sqlite3
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.page import Page
+from famous_people_network.page_store import PageStore
+
+
+# Streams (title, redirect target, wikitext) for every main namespace page,
+# clearing parsed elements so memory stays flat however large the dump is
+def iter_dump_pages(path):
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rb") as file:
+        context = ElementTree.iterparse(file, events=("start", "end"))
+        _, root = next(context)
+        namespace = root.tag[: root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+
+        for event, element in context:
+            if event != "end" or element.tag != namespace + "page":
+                continue
+            if element.findtext(namespace + "ns") == "0":
+                redirect = element.find(namespace + "redirect")
+                yield (
+                    element.findtext(namespace + "title"),
+                    redirect.get("title") if redirect is not None else None,
+                    element.findtext(namespace + "revision/" + namespace + "text") or "",
+                )
+            root.clear()
+
+
+def normalize_title(title):
+    title = title.split("#", 1)[0].replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+def lead_section(wikitext):
+    match = re.search(r"\n==[^=]", wikitext)
+    return wikitext[: match.start()] if match else wikitext
+
+
+# Rough plain text of the lead, standing in for the API's 5 sentence extract
+def plain_summary(lead, sentences=5):
+    text = re.sub(r"<!--.*?-->", "", lead, flags=re.S)
+    text = re.sub(r"<ref[^>]*/>|<ref[^>]*>.*?</ref>", "", text, flags=re.S)
+    for _ in range(10):
+        text, count = re.subn(r"\{\{[^{}]*\}\}", "", text)
+        if not count:
+            break
+    text = re.sub(r"\{\|.*?\|\}", "", text, flags=re.S)
+    for _ in range(3):
+        text = re.sub(r"\[\[(?:File|Image):[^\[\]]*\]\]", "", text)
+        text = re.sub(r"\[\[(?:[^\[\]|]*\|)?([^\[\]|]*)\]\]", r"\1", text)
+    text = re.sub(r"'{2,}", "", text)
+    text = re.sub(r"<[^>]+>", "", text)
+    text = " ".join(text.split())
+    return " ".join(re.split(r"(?<=\.)\s+", text)[:sentences])
+
+
+# Runs in the worker processes
+def parse_batch(batch):
+    people = []
+    for title, text in batch:
+        lead = lead_section(text)
+        page = Page(title=title, sidebar=lead, summary=plain_summary(lead))
+        if not page.is_person():
+            continue
+        links = {}
+        for link, fields in page.sidebar_link_fields.items():
+            if not link or link.startswith(":"):
+                continue
+            links.setdefault(normalize_title(link), []).extend(fields)
+        people.append((title, page.sidebar, page.summary, links))
+    return people
+
+
+class DumpIndexer:
+    def __init__(self, index_path, workers=None, batch_size=200, max_pending=None):
+        self.index_path = index_path
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.max_pending = max_pending or 2 * self.workers
+        self.pages = 0
+        self.people = 0
+        self.redirects = 0
+        self.edges = 0
+
+    def build(self, dump_path, edges_path=None):
+        store = PageStore(self.index_path, ttl=None)
+        store.close()
+        connection = sqlite3.connect(self.index_path)
+        connection.execute("DROP TABLE IF EXISTS links")
+        connection.execute("CREATE TABLE links (source TEXT, target TEXT, labels TEXT)")
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            for batch in self._batches(connection, dump_path):
+                if len(pending) >= self.max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._write_people(connection, done)
+                pending.add(executor.submit(parse_batch, batch))
+            self._write_people(connection, pending)
+
+        self._write_edges(connection, edges_path)
+        connection.execute("DROP TABLE links")
+        connection.commit()
+        connection.execute("VACUUM")
+        connection.close()
+
+    def _batches(self, connection, dump_path):
+        batch = []
+        aliases = []
+        for title, redirect, text in iter_dump_pages(dump_path):
+            if redirect is not None:
+                aliases.append((title, normalize_title(redirect)))
+                if len(aliases) >= 10000:
+                    self._write_aliases(connection, aliases)
+                    aliases = []
+                continue
+
+            self.pages += 1
+            batch.append((title, text))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        self._write_aliases(connection, aliases)
+
+    def _write_aliases(self, connection, aliases):
+        self.redirects += len(aliases)
+        connection.executemany("INSERT OR REPLACE INTO aliases VALUES (?, ?)", aliases)
+        connection.commit()
+
+    def _write_people(self, connection, futures):
+        fetched = time.time()
+        for future in futures:
+            people = future.result()
+            self.people += len(people)
+            connection.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, NULL, NULL, ?, 1)",
+                [(title, sidebar, summary, fetched) for title, sidebar, summary, links in people],
+            )
+            connection.executemany(
+                "INSERT INTO links VALUES (?, ?, ?)",
+                [
+                    (title, link, json.dumps(fields))
+                    for title, sidebar, summary, links in people
+                    for link, fields in links.items()
+                ],
+            )
+        connection.commit()
+
+    # Resolves link targets through the redirects and keeps the ones that
+    # land on people. Runs inside SQLite so it never has to fit in memory
+    def _write_edges(self, connection, edges_path):
+        connection.execute("DROP TABLE IF EXISTS edges")
+        connection.execute(
+            "CREATE TABLE edges (source TEXT, target TEXT, labels TEXT, PRIMARY KEY (source, target))"
+        )
+        rows = connection.execute(
+            """
+            SELECT links.source, COALESCE(aliases.title, links.target) AS resolved, links.labels
+            FROM links
+            LEFT JOIN aliases ON aliases.alias = links.target
+            JOIN pages ON pages.title = COALESCE(aliases.title, links.target) AND pages.person = 1
+            ORDER BY links.source, resolved
+            """
+        )
+
+        edges_file = open(edges_path, "w", encoding="utf-8") if edges_path else None
+        insert = connection.cursor()
+        previous = None
+        labels = []
+        for source, target, link_labels in rows:
+            if (source, target) != previous:
+                if previous is not None:
+                    self._write_edge(insert, edges_file, previous, labels)
+                previous = (source, target)
+                labels = []
+            labels.extend(json.loads(link_labels))
+        if previous is not None:
+            self._write_edge(insert, edges_file, previous, labels)
+        if edges_file is not None:
+            edges_file.close()
+
+    def _write_edge(self, cursor, edges_file, edge, labels):
+        source, target = edge
+        cursor.execute("INSERT INTO edges VALUES (?, ?, ?)", (source, target, json.dumps(labels)))
+        if edges_file is not None:
+            edges_file.write(source + "\t" + target + "\t" + json.dumps(labels) + "\n")
+        self.edges += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a person index from a Wikipedia XML dump")
+    parser.add_argument("dump", help="pages-articles.xml.bz2 or an uncompressed .xml dump")
+    parser.add_argument("index", help="SQLite index to write")
+    parser.add_argument("--edges", help="also write the edge list as TSV")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    indexer = DumpIndexer(args.index, workers=args.workers, batch_size=args.batch_size)
+    start = time.time()
+    indexer.build(args.dump, args.edges)
+    print(
+        "%d pages, %d redirects, %d people, %d edges in %.1fs"
+        % (indexer.pages, indexer.redirects, indexer.people, indexer.edges, time.time() - start)
+    )
+
+
+if __name__ == "__main__":
+    main()
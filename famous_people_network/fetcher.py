@@ -0,0 +1,46 @@
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.http_client import HttpClient
+
+
+class Fetcher:
+    def __init__(self, concurrency=4, client=None):
+        self.concurrency = concurrency
+        self.client = client if client is not None else HttpClient(pool_size=concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    # Raises ApiError for error answers instead of returning them
+    def get(self, url, params):
+        return self.client.get(url, params)
+
+    # Yields every response of a batched query as it arrives. All chunks are
+    # in flight at once (up to the concurrency cap) and each continuation is
+    # queued as soon as the response that asks for it comes back
+    def query(self, url, params, titles, step=50):
+        pending = set()
+        for i in range(0, len(titles), step):
+            chunk_params = dict(params, titles="|".join(titles[i : i + step]))
+            pending.add(self._submit(url, chunk_params, chunk_params))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_params, data = future.result()
+                if "query" not in data:
+                    # Nothing matched, e.g. only invalid titles were asked for
+                    continue
+                if "continue" in data:
+                    continue_params = dict(chunk_params, **data["continue"])
+                    pending.add(self._submit(url, chunk_params, continue_params))
+                yield data
+
+    def _submit(self, url, chunk_params, params):
+        return self.executor.submit(lambda: (chunk_params, self.get(url, params)))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.client.close()
@@ -0,0 +1,152 @@
+import sys
+import os
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.tracing import tracer
+
+
+# An "error" answer from the API, or a request that kept failing after all
+# retries
+class ApiError(Exception):
+    def __init__(self, code, info):
+        super().__init__(code + ": " + info)
+        self.code = code
+        self.info = info
+
+
+# Allows rate requests per second on average and bursts of up to burst
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Pooled session shared by every fetch. Retries connection errors, timeouts,
+# 429, 5xx and maxlag answers with exponential backoff (or the Retry-After
+# the server asks for), and counts requests, retries, latency and bytes per
+# endpoint
+class HttpClient:
+    user_agent = "famous-people-network/0.1 (https://github.com/SpoopyPillow/famous-people-network)"
+
+    def __init__(
+        self,
+        pool_size=8,
+        timeout=(5, 30),
+        retries=5,
+        backoff=0.5,
+        max_backoff=30,
+        rate=50,
+        burst=20,
+        maxlag=5,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.maxlag = maxlag
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": self.user_agent, "Accept-Encoding": "gzip"})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, url, params):
+        if self.maxlag is not None:
+            params = dict(params, maxlag=self.maxlag)
+        endpoint = self._endpoint(url, params)
+
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self._count(endpoint, time.perf_counter() - start, 0, failed=True)
+                if attempt == self.retries:
+                    raise ApiError("http", str(error)) from error
+                self._sleep(attempt, None)
+                continue
+
+            size = int(response.headers.get("Content-Length") or len(response.content))
+            self._count(endpoint, time.perf_counter() - start, size, failed=not response.ok)
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == self.retries:
+                    raise ApiError("http", "%d from %s" % (response.status_code, url))
+                self._sleep(attempt, response.headers.get("Retry-After"))
+                continue
+            response.raise_for_status()
+
+            data = response.json()
+            error = data.get("error")
+            if error is None:
+                return data
+            if error.get("code") == "maxlag" and attempt < self.retries:
+                self._sleep(attempt, response.headers.get("Retry-After"))
+                continue
+            raise ApiError(error.get("code", "unknown"), error.get("info", ""))
+
+    def _sleep(self, attempt, retry_after):
+        tracer.count("http.retries")
+        if retry_after is not None and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            delay = self.backoff * 2**attempt * (1 + random.random())
+        time.sleep(min(delay, self.max_backoff))
+
+    # Host and path plus the API module the request is for
+    def _endpoint(self, url, params):
+        parts = urlsplit(url)
+        module = params.get("prop") or params.get("list") or params.get("action") or ""
+        return parts.netloc + parts.path + " " + module
+
+    def _count(self, endpoint, latency, size, failed=False):
+        tracer.record("http.request", latency)
+        tracer.count("http.bytes", size)
+        with self.lock:
+            counter = self.counters.setdefault(
+                endpoint, {"requests": 0, "failed": 0, "latency": 0.0, "max_latency": 0.0, "bytes": 0}
+            )
+            counter["requests"] += 1
+            counter["failed"] += failed
+            counter["latency"] += latency
+            counter["max_latency"] = max(counter["max_latency"], latency)
+            counter["bytes"] += size
+
+    def stats(self):
+        with self.lock:
+            return {
+                endpoint: dict(counter, mean_latency=counter["latency"] / counter["requests"])
+                for endpoint, counter in self.counters.items()
+            }
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,105 @@
+import sys
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.tracing import tracer
+
+
+class Job:
+    def __init__(self, description):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.status = "queued"
+        self.level = 0
+        self.depth = 0
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.timings = None
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def report(self, level, depth):
+        self.level = level
+        self.depth = depth
+
+    def done(self):
+        return self.status in ("done", "cancelled", "failed")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "description": self.description,
+            "status": self.status,
+            "level": self.level,
+            "depth": self.depth,
+            "error": self.error,
+        }
+
+
+# Runs expansions on a thread pool so requests return immediately. Jobs
+# report progress per level and stop at the next level when cancelled
+class JobManager:
+    def __init__(self, workers=4, keep=10 * 60):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.keep = keep
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    # function is called as function(*args, progress=job.report, cancel=job.cancel_event)
+    def submit(self, description, function, *args):
+        job = Job(description)
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, function, args)
+        return job
+
+    def _run(self, job, function, args):
+        if job.cancelled():
+            job.status = "cancelled"
+            job.finished = time.time()
+            return
+        job.status = "running"
+        job.started = time.time()
+        before = tracer.snapshot()
+        try:
+            job.result = function(*args, progress=job.report, cancel=job.cancel_event)
+            job.status = "cancelled" if job.cancelled() else "done"
+        except Exception as error:
+            job.error = str(error)
+            job.status = "failed"
+        job.timings = tracer.since(before)
+        job.finished = time.time()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def discard(self, job_id):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [
+            job_id for job_id, job in self.jobs.items() if job.done() and now - job.finished > self.keep
+        ]:
+            del self.jobs[job_id]
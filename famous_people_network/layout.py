@@ -0,0 +1,254 @@
+import math
+from collections import deque
+import numpy as np
+import networkx as nx
+
+
+# Fruchterman-Reingold layout that keeps positions between updates and only
+# moves the nodes around what changed. With barnes_hut, repulsion from far
+# away nodes is approximated by the centroids of grid cells
+class ForceLayout:
+    def __init__(
+        self,
+        edge_length=150.0,
+        iterations=80,
+        incremental_iterations=30,
+        barnes_hut=True,
+        gravity=0.01,
+        component_gravity=2.0,
+        seed=8,
+    ):
+        self.edge_length = edge_length
+        self.iterations = iterations
+        self.incremental_iterations = incremental_iterations
+        self.barnes_hut = barnes_hut
+        self.gravity = gravity
+        self.component_gravity = component_gravity
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        self.positions = {}
+        self.moved = set()
+        self.version = None
+
+    # Updates positions for the current graph. Nodes in `changed` (and their
+    # neighbors) are relaxed even if they were already placed. iterations
+    # overrides the number of simulation steps
+    def update(self, graph, version=None, changed=(), iterations=None):
+        if version is not None and version == self.version:
+            return self.positions
+        self.version = version
+
+        for node in [node for node in self.positions if node not in graph]:
+            del self.positions[node]
+
+        added = [node for node in graph if node not in self.positions]
+        changed = [node for node in changed if node in graph]
+        self.moved = set()
+        if not added and not changed:
+            return self.positions
+
+        full = len(added) == len(graph)
+        if full:
+            active = set(graph)
+        else:
+            active = set(added)
+            for node in [*added, *changed]:
+                active.add(node)
+                active.update(nx.all_neighbors(graph, node))
+
+        nodes = list(graph)
+        index = {node: i for i, node in enumerate(nodes)}
+        positions = np.zeros((len(nodes), 2), order="F")
+        for node, position in self.positions.items():
+            positions[index[node]] = position
+        self._place(graph, positions, index, added, full)
+
+        active_index = np.fromiter((index[node] for node in active), dtype=np.int64)
+        edges = self._edges(graph, index, active)
+        if iterations is None:
+            iterations = self.iterations if full else self.incremental_iterations
+        components = self._components(graph, index) if full else None
+        self._simulate(positions, active_index, edges, iterations, full, components)
+
+        for node in active:
+            self.positions[node] = (float(positions[index[node], 0]), float(positions[index[node], 1]))
+        self.moved = active
+        return self.positions
+
+    # Places new nodes in breadth-first order next to their already placed
+    # neighbors. Nodes with none start a new component on the outskirts
+    def _place(self, graph, positions, index, added, full):
+        k = self.edge_length
+        placed = set(self.positions)
+        if placed:
+            center = positions[[index[node] for node in placed]].mean(axis=0)
+        else:
+            center = np.zeros(2)
+        spread = k * math.sqrt(len(graph))
+
+        pending = set(added)
+        queue = deque(
+            node for node in added if any(n in placed for n in nx.all_neighbors(graph, node))
+        )
+        roots = iter(added)
+        while pending:
+            if queue:
+                node = queue.popleft()
+                if node not in pending:
+                    continue
+                anchors = [index[n] for n in nx.all_neighbors(graph, node) if n in placed]
+                position = positions[anchors].mean(axis=0) + self.rng.normal(0, k / 2, 2)
+            else:
+                node = next(node for node in roots if node in pending)
+                if full:
+                    position = self.rng.uniform(-spread / 2, spread / 2, 2)
+                else:
+                    angle = self.rng.uniform(0, 2 * math.pi)
+                    position = center + spread / 2 * np.array([math.cos(angle), math.sin(angle)])
+
+            positions[index[node]] = position
+            placed.add(node)
+            pending.discard(node)
+            queue.extend(n for n in nx.all_neighbors(graph, node) if n in pending)
+
+    def _edges(self, graph, index, active):
+        edges = set()
+        for node in active:
+            i = index[node]
+            for neighbor in nx.all_neighbors(graph, node):
+                j = index[neighbor]
+                if i != j:
+                    edges.add((min(i, j), max(i, j)))
+        if not edges:
+            return np.empty((0, 2), dtype=np.int64)
+        return np.array(list(edges), dtype=np.int64)
+
+    # Connected component of every node, numbered from the largest
+    def _components(self, graph, index):
+        if graph.is_directed():
+            found = nx.weakly_connected_components(graph)
+        else:
+            found = nx.connected_components(graph)
+        components = np.zeros(len(index), dtype=np.int64)
+        for number, component in enumerate(sorted(found, key=len, reverse=True)):
+            components[[index[node] for node in component]] = number
+        return components
+
+    def _simulate(self, positions, active, edges, iterations, full, components=None):
+        k = self.edge_length
+        temperature = k * math.sqrt(len(active)) / 4 if full else k
+
+        for iteration in range(iterations):
+            displacement = np.zeros((len(positions), 2))
+            displacement[active] = self._repulsion(positions, active)
+
+            if len(edges):
+                delta = positions[edges[:, 0]] - positions[edges[:, 1]]
+                distance = np.sqrt((delta**2).sum(axis=1))[:, None]
+                force = delta * distance / k
+                for axis in range(2):
+                    pull = np.bincount(edges[:, 1], weights=force[:, axis], minlength=len(positions))
+                    pull -= np.bincount(edges[:, 0], weights=force[:, axis], minlength=len(positions))
+                    displacement[:, axis] += pull
+
+            center = positions.mean(axis=0)
+            displacement[active] -= self.gravity * (positions[active] - center) * k / 10
+            # The rest of the graph pushes a component it has no edges to until
+            # gravity balances it far outside, so components as a whole are
+            # pulled towards the center as well, without changing their shape
+            if components is not None:
+                sizes = np.bincount(components)
+                for axis in range(2):
+                    centroids = np.bincount(components, weights=positions[:, axis]) / sizes
+                    displacement[:, axis] -= self.component_gravity * (centroids[components] - center[axis])
+
+            step = temperature * (1 - iteration / iterations)
+            moves = displacement[active]
+            length = np.sqrt((moves**2).sum(axis=1))[:, None]
+            length[length == 0] = 1
+            positions[active] += moves / length * np.minimum(length, step)
+
+    def _repulsion(self, positions, active, block=512):
+        if self.barnes_hut and len(positions) > 1000:
+            return self._repulsion_grid(positions, active, block)
+
+        force = np.zeros((len(active), 2))
+        for start in range(0, len(active), block):
+            rows = active[start : start + block]
+            delta = positions[rows][:, None, :] - positions[None, :, :]
+            distance2 = (delta**2).sum(axis=2)
+            distance2[np.arange(len(rows)), rows] = np.inf
+            distance2 = np.maximum(distance2, 1e-2)
+            force[start : start + block] = (delta * (self.edge_length**2 / distance2)[:, :, None]).sum(axis=1)
+        return force
+
+    # Exact repulsion from nodes in the 3x3 neighboring cells, centroid
+    # approximation for every other occupied cell
+    def _repulsion_grid(self, positions, active, block):
+        k2 = self.edge_length**2
+        # Cells are sized by where most nodes are, and the few far outside
+        # share the cells along the border
+        outer = len(positions) // 100
+        low, high = np.partition(positions, [outer, len(positions) - 1 - outer], axis=0)[
+            [outer, len(positions) - 1 - outer]
+        ]
+        extent = float((high - low).max())
+        cell_size = max(self.edge_length / 4, extent / max(4, math.sqrt(len(positions)) / 2))
+        width = int(extent / cell_size) + 3
+
+        cells = np.clip((positions - low) // cell_size + 1, 0, width - 1).astype(np.int64)
+        keys = cells[:, 0] * width + cells[:, 1]
+        occupied, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        centroids = np.zeros((len(occupied), 2))
+        np.add.at(centroids, inverse, positions)
+        centroids /= counts[:, None]
+        occupied_cells = np.stack([occupied // width, occupied % width], axis=1)
+
+        # Far field is evaluated once per cell holding an active node and
+        # shared by every node in that cell
+        active_cells, active_inverse = np.unique(inverse[active], return_inverse=True)
+        far = np.zeros((len(active_cells), 2))
+        for start in range(0, len(active_cells), block):
+            rows = active_cells[start : start + block]
+            dx = centroids[rows, 0][:, None] - centroids[None, :, 0]
+            dy = centroids[rows, 1][:, None] - centroids[None, :, 1]
+            distance2 = np.maximum(dx**2 + dy**2, 1e-2)
+            near = (np.abs(occupied_cells[rows, 0][:, None] - occupied_cells[None, :, 0]) <= 1) & (
+                np.abs(occupied_cells[rows, 1][:, None] - occupied_cells[None, :, 1]) <= 1
+            )
+            weight = np.where(near, 0, counts[None, :] * k2 / distance2)
+            far[start : start + block, 0] = (dx * weight).sum(axis=1)
+            far[start : start + block, 1] = (dy * weight).sum(axis=1)
+        force = far[active_inverse]
+
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        offsets = np.array([dx * width + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        neighbor_x = cells[active][:, 0][:, None] + np.repeat([-1, 0, 1], 3)[None, :]
+        neighbor_y = cells[active][:, 1][:, None] + np.tile([-1, 0, 1], 3)[None, :]
+        valid = (neighbor_x >= 0) & (neighbor_x < width) & (neighbor_y >= 0) & (neighbor_y < width)
+        neighbor_keys = keys[active][:, None] + offsets[None, :]
+        starts = np.searchsorted(sorted_keys, neighbor_keys, side="left")
+        ends = np.searchsorted(sorted_keys, neighbor_keys, side="right")
+        sizes = np.where(valid, ends - starts, 0).ravel()
+
+        total = int(sizes.sum())
+        if total:
+            owner = np.repeat(np.repeat(np.arange(len(active)), 9), sizes)
+            first = np.repeat(starts.ravel(), sizes)
+            within = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            other = order[first + within]
+            source = active[owner]
+            keep = other != source
+            owner, source, other = owner[keep], source[keep], other[keep]
+
+            x, y = positions[:, 0], positions[:, 1]
+            dx = x[source] - x[other]
+            dy = y[source] - y[other]
+            weight = k2 / np.maximum(dx * dx + dy * dy, 1e-2)
+            force[:, 0] += np.bincount(owner, weights=dx * weight, minlength=len(active))
+            force[:, 1] += np.bincount(owner, weights=dy * weight, minlength=len(active))
+
+        return force
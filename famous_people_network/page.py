@@ -1,38 +1,79 @@
 import re
 import sys
+import time
 import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
+from famous_people_network.tracing import tracer
+
 
 class Page:
-    def __init__(self, title="", sidebar="", summary=""):
+    link_pattern = re.compile(r"\[\[(.*?)[\|\]]")
+    field_pattern = re.compile(r"\n\s*\|\s*")
+
+    def __init__(self, title="", sidebar="", summary="", revision=None):
         self.title = title
         self.sidebar = sidebar
         self.summary = summary
+        self.revision = revision
+        self.fetched = time.time()
         self.image = None
-        self.user_added = False
 
     def __hash__(self):
         return self.title.__hash__()
 
-    def extract_sidebar_links(self):
-        lines = re.split(r"\n\s*\|\s*", self.sidebar)[1:-1]
-        output = set()
-        for line in lines:
-            output.update(re.findall(r".*?\[\[(.*?)[\|\]]", line))
+    @property
+    def sidebar(self):
+        return self._sidebar
+
+    @sidebar.setter
+    def sidebar(self, sidebar):
+        self._sidebar = sidebar
+        self._sidebar_fields = None
+        self._sidebar_link_fields = None
+
+    # Infobox field -> links, parsed once on first use
+    @property
+    def sidebar_fields(self):
+        if self._sidebar_fields is None:
+            self._parse_sidebar()
+        return self._sidebar_fields
 
-        return list(output)
+    # Link -> infobox fields it appears in
+    @property
+    def sidebar_link_fields(self):
+        if self._sidebar_link_fields is None:
+            self._parse_sidebar()
+        return self._sidebar_link_fields
+
+    @tracer.traced("page.parse")
+    def _parse_sidebar(self):
+        fields = {}
+        link_fields = {}
+        for line in self.field_pattern.split(self._sidebar)[1:-1]:
+            links = self.link_pattern.findall(line)
+            if not links:
+                continue
+            field = line.split("=", 1)[0].strip() if "=" in line else None
+            for link in dict.fromkeys(links):
+                infos = link_fields.setdefault(link, [])
+                if field is not None:
+                    infos.append(field)
+                    fields.setdefault(field, []).append(link)
+
+        self._sidebar_fields = fields
+        self._sidebar_link_fields = link_fields
+
+    def extract_sidebar_links(self):
+        return list(self.sidebar_link_fields)
 
     def extract_sidebar_link_info(self, link):
         if isinstance(link, Page):
             link = link.title
-        lines = re.split(r"\n\s*\|\s*", self.sidebar)[1:-1]
-        infos = []
-        for line in lines:
-            infos.extend(re.findall(r"(.*?)\s*=.*?\[\[" + link + r"[\|\]]", line))
-        return infos
+        return list(self.sidebar_link_fields.get(link, []))
 
+    @tracer.traced("page.is_person")
     def is_person(self):
         # TODO More checks for person
         return (
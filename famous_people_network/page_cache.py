@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+
+# Process wide LRU of fetched pages that every Wiki can share. A title maps to
+# its Page, or to None once it is known not to be a person. Aliases from
+# normalization and redirects are kept in a second LRU of their own
+class PageCache:
+    def __init__(self, capacity=50000, alias_capacity=100000):
+        self.capacity = capacity
+        self.alias_capacity = alias_capacity
+        self.pages = OrderedDict()
+        self.aliases = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.pages)
+
+    # Whether the title has a page or is known not to be a person. Does not
+    # count as a lookup
+    def __contains__(self, title):
+        with self.lock:
+            return title in self.pages
+
+    # Returns the cached people and the titles the cache knows nothing about.
+    # Titles known not to be people are in neither
+    def lookup(self, titles):
+        pages = {}
+        missing = []
+        with self.lock:
+            for title in titles:
+                if title in self.pages:
+                    self.pages.move_to_end(title)
+                    self.hits += 1
+                    if self.pages[title] is not None:
+                        pages[title] = self.pages[title]
+                else:
+                    self.misses += 1
+                    missing.append(title)
+        return pages, missing
+
+    def get(self, title):
+        with self.lock:
+            return self.pages.get(title)
+
+    def update(self, pages):
+        with self.lock:
+            for title, page in pages.items():
+                self.pages[title] = page
+                self.pages.move_to_end(title)
+            while len(self.pages) > self.capacity:
+                self.pages.popitem(last=False)
+                self.evictions += 1
+
+    def update_aliases(self, aliases):
+        with self.lock:
+            for alias, title in aliases.items():
+                self.aliases[alias] = title
+                self.aliases.move_to_end(alias)
+            while len(self.aliases) > self.alias_capacity:
+                self.aliases.popitem(last=False)
+
+    # Title the API answered with for a requested title, following
+    # normalization and then redirect
+    def resolve(self, title):
+        with self.lock:
+            for _ in range(3):
+                if title not in self.aliases:
+                    break
+                title = self.aliases[title]
+        return title
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "pages": len(self.pages),
+                "aliases": len(self.aliases),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.aliases.clear()
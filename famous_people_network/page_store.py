@@ -0,0 +1,138 @@
+import sys
+import os
+import time
+import sqlite3
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.page import Page
+
+
+class PageStore:
+    def __init__(self, path, ttl=7 * 24 * 60 * 60):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    title TEXT PRIMARY KEY,
+                    sidebar TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    image TEXT,
+                    revision INTEGER,
+                    fetched REAL NOT NULL,
+                    person INTEGER NOT NULL
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, title TEXT NOT NULL)"
+            )
+
+    # Returns stored pages (None for titles known not to be people), with
+    # expired entries split out with their revision so they can be revalidated
+    def load(self, titles):
+        fresh = {}
+        stale = {}
+        now = time.time()
+        step = 500
+
+        for i in range(0, len(titles), step):
+            chunk = titles[i : i + step]
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT title, sidebar, summary, image, revision, fetched, person FROM pages"
+                    " WHERE title IN (" + ",".join("?" * len(chunk)) + ")",
+                    chunk,
+                ).fetchall()
+
+            for title, sidebar, summary, image, revision, fetched, person in rows:
+                page = None
+                if person:
+                    page = Page(title=title, sidebar=sidebar, summary=summary, revision=revision)
+                    page.image = image
+                    page.fetched = fetched
+
+                if self.ttl is not None and now - fetched > self.ttl:
+                    stale[title] = (revision, page)
+                else:
+                    fresh[title] = page
+
+        return fresh, stale
+
+    def save(self, pages):
+        rows = [
+            (
+                page.title,
+                page.sidebar if page.is_person() else "",
+                page.summary if page.is_person() else "",
+                page.image,
+                page.revision,
+                page.fetched,
+                int(page.is_person()),
+            )
+            for page in pages
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    # Remembers titles that are not people without storing any of their text
+    def save_negatives(self, titles):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, '', '', NULL, NULL, ?, 0)",
+                [(title, now) for title in titles],
+            )
+
+    def person_titles(self):
+        with self.lock:
+            return [title for (title,) in self.connection.execute("SELECT title FROM pages WHERE person = 1")]
+
+    def load_aliases(self, titles):
+        aliases = {}
+        step = 500
+        for i in range(0, len(titles), step):
+            chunk = titles[i : i + step]
+            with self.lock:
+                aliases.update(
+                    self.connection.execute(
+                        "SELECT alias, title FROM aliases WHERE alias IN (" + ",".join("?" * len(chunk)) + ")",
+                        chunk,
+                    ).fetchall()
+                )
+        return aliases
+
+    def save_aliases(self, aliases):
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO aliases VALUES (?, ?)", aliases.items())
+
+    def touch(self, titles):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE pages SET fetched = ? WHERE title = ?", [(now, title) for title in titles]
+            )
+
+    def update_image(self, title, image):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE pages SET image = ? WHERE title = ?", (image, title))
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM pages")
+            self.connection.execute("DELETE FROM aliases")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -1,126 +1,691 @@
 import sys
 import os
 import json
+import math
+import threading
+from collections import Counter, deque
 import networkx as nx
 import colorsys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from famous_people_network.wiki import Wiki
+from famous_people_network.page_store import PageStore
+from famous_people_network.layout import ForceLayout
+from famous_people_network.communities import CommunityTracker
+from famous_people_network.compact_graph import CompactGraph, networkx_memory_usage
+from famous_people_network.tracing import tracer
+from famous_people_network import snapshot
 
 
 class PeopleNetwork:
-    def __init__(self):
-        self.graph = nx.DiGraph()
-        self.wiki = Wiki()
+    # Sessions pass one shared wiki so they fetch through the same page cache.
+    # portrait_url(image, size) gives the URL a node of that size loads its
+    # portrait from, the image itself when not set
+    def __init__(self, store=None, compact=False, wiki=None, portrait_url=None):
+        self.compact = compact
+        self.graph = CompactGraph() if compact else nx.DiGraph()
+        self.networkx_graph = (None, None)
+        self.wiki = wiki if wiki is not None else Wiki(store=store)
+        self.pages = {}
+        self.user_added = set()
+        self.owned = {}
+        self.owners = {}
+        self.portrait_url = portrait_url
+        self.portraits_checked = set()
+        self.layout = ForceLayout()
+        self.communities = CommunityTracker()
+        self.relayout = set()
+        self.provisional = set()
+        self.provisional_iterations = 10
+        self.lod_threshold = 2000
+        self.lod_cluster_minimum = 5
+        self.element_limit = 3000
+        self.lod = False
+        self.expanded = []
+        self.in_view = []
+        self.centroids = {}
+        self.version = 0
+        self.elements = {}
+        self.change_log = deque()
+        self.log_start = 0
+        self.log_limit = 5000
+        self.lock = threading.RLock()
+
+    # Serves pages from an index built by famous_people_network.dump
+    # instead of the API
+    def load_index(self, path):
+        self.wiki = Wiki(store=PageStore(path, ttl=None), offline=True)
+        self.reset_graph()
+
+    def save_snapshot(self, path):
+        with self.lock:
+            snapshot.save(self, path)
+
+    def load_snapshot(self, path):
+        snapshot.load(self, path)
 
     def reset_graph(self):
-        self.graph = nx.DiGraph()
+        with self.lock:
+            self.graph = CompactGraph() if self.compact else nx.DiGraph()
+            self.pages = {}
+            self.user_added = set()
+            self.owned = {}
+            self.owners = {}
+            self.portraits_checked = set()
+            self.layout.reset()
+            self.communities.reset()
+            self.relayout = set()
+            self.provisional = set()
+            self.expanded = []
+            self.in_view = []
+            self.centroids = {}
+            self.version += 1
+
+    # progress(level, depth) is called as each level lands in the graph and
+    # the expansion stops before the next level once cancel is set
+    @tracer.traced("network.add_person")
+    def add_person(self, title, depth=0, progress=None, cancel=None):
+        found = False
+        for level, people in self.expand_person(title, depth, cancel):
+            found = True
+            if progress is not None:
+                progress(level, depth)
+        if found and (cancel is None or not cancel.is_set()):
+            self.update_portraits()
+        return found
 
-    def add_person(self, title, depth=0):
-        pages = self.wiki.extract_people(title)
+    # Adds the person and then their neighborhood one level at a time,
+    # yielding (level, people reached) after each level is in the graph so it
+    # can be rendered while the next one is fetched. Fetching happens outside
+    # the lock so several expansions can run at once
+    def expand_person(self, title, depth=0, cancel=None):
+        pages = self._extract_people([title])
         if not pages:
-            return False
-        title = pages[0]
-        self.graph.add_node(title)
-        self.wiki.update_portraits(title)
-        self.get_page(title).user_added = True
+            return
+        title, page = next(iter(pages.items()))
+        known = dict(pages)
+        with self.lock:
+            self.version += 1
+            self.graph.add_node(title)
+            self.pages[title] = page
+            self.portraits_checked.add(title)
+            self.user_added.add(title)
+            self._own(title, [title])
+        yield 0, [title]
 
         is_connected = set()
         people = [title]
         for level in range(depth):
-            pages = self.wiki.extract_pages(people)
-            people = []
-            for person, page in pages.items():
-                if person in is_connected:
-                    continue
-
-                neighbors = page.extract_sidebar_links()
-                people_neighbors = self.wiki.extract_people(neighbors)
-
-                for neighbor in people_neighbors:
-                    self.graph.add_edge(
-                        person,
-                        neighbor,
-                        labels=json.dumps(page.extract_sidebar_link_info(neighbor)),
-                    )
-
-                    neighbor_page = self.get_page(neighbor)
+            if cancel is not None and cancel.is_set():
+                return
+
+            frontier = [known[person] for person in people if person not in is_connected]
+
+            links = set()
+            for page in frontier:
+                links.update(page.extract_sidebar_links())
+            people_links = self._extract_people(list(links))
+            known.update(people_links)
+
+            with self.lock, tracer.span("network.link"):
+                # Stops when cancelled or when the seed was removed meanwhile
+                if (cancel is not None and cancel.is_set()) or title not in self.owned:
+                    return
+                self.version += 1
+                edges = []
+                people = {}
+                for page in frontier:
+                    neighbors = {}
+                    for link in page.extract_sidebar_links():
+                        neighbor = self.wiki.resolve(link)
+                        if neighbor in people_links:
+                            neighbors.setdefault(neighbor, []).extend(page.extract_sidebar_link_info(link))
+                    for neighbor, labels in neighbors.items():
+                        edges.append((page.title, neighbor, {"labels": json.dumps(labels)}))
+
+                    people.update(dict.fromkeys(neighbors))
+                    is_connected.add(page.title)
+                self.graph.add_edges_from(edges)
+                self.pages.update((person, known[person]) for person in people)
+                self.portraits_checked.update(people)
+
+                edges = []
+                for neighbor in people:
+                    neighbor_page = known[neighbor]
                     for neighbor_link in neighbor_page.extract_sidebar_links():
-                        if self.graph.has_node(neighbor_link):
-                            self.graph.add_edge(
-                                neighbor,
-                                neighbor_link,
-                                labels=json.dumps(
-                                    neighbor_page.extract_sidebar_link_info(neighbor_link)
-                                ),
-                            )
-
-                people.extend(people_neighbors)
-                is_connected.add(person)
+                        target = self.wiki.resolve(neighbor_link)
+                        if self.graph.has_node(target):
+                            labels = neighbor_page.extract_sidebar_link_info(neighbor_link)
+                            edges.append((neighbor, target, {"labels": json.dumps(labels)}))
+                self.graph.add_edges_from(edges)
 
-        return True
+                people = list(people)
+                self._own(title, people)
+            yield level + 1, people
+
+    # Shortest chain of infobox links between two people, where a link in
+    # either person's infobox connects them. Searches from both ends one level
+    # at a time until no chain it has not seen could be shorter, and adds only
+    # the path to the graph. Returns the path, or None if there is none within
+    # max_levels levels
+    @tracer.traced("network.connect_people")
+    def connect_people(self, source, target, max_levels=6, progress=None, cancel=None):
+        pages = self._extract_people([source, target])
+        source, target = self.wiki.resolve(source), self.wiki.resolve(target)
+        if source not in pages or target not in pages:
+            return None
+
+        known = dict(pages)
+        sides = [
+            {"parents": {source: None}, "depths": {source: 0}, "frontier": [source], "depth": 0},
+            {"parents": {target: None}, "depths": {target: 0}, "frontier": [target], "depth": 0},
+        ]
+        # (length, node on the source side, node on the target side)
+        best = None
+        if source == target:
+            best = (0, source, target)
+        elif self._link_labels(known[source], target) or self._link_labels(known[target], source):
+            best = (1, source, target)
+
+        for level in range(max_levels):
+            if cancel is not None and cancel.is_set():
+                break
+            # Links are only followed out of the people a side has reached, so a
+            # chain not found yet runs past the searched levels of a side that
+            # can still grow and then crosses over with one more link
+            growing = [side for side in sides if side["frontier"]]
+            if not growing or (best is not None and best[0] <= min(side["depth"] for side in growing) + 2):
+                break
+            if progress is not None:
+                progress(level, max_levels)
+
+            # Until the sides meet the smaller frontier grows, afterwards the
+            # shallower side, which is what raises the bound above
+            if best is None:
+                side = min(growing, key=lambda side: len(side["frontier"]))
+            else:
+                side = min(growing, key=lambda side: side["depth"])
+            other = sides[1] if side is sides[0] else sides[0]
+            side["depth"] += 1
 
+            links = set()
+            for person in side["frontier"]:
+                links.update(known[person].extract_sidebar_links())
+            people = self._extract_people(list(links))
+            known.update(people)
+
+            frontier = []
+            for person in side["frontier"]:
+                for link in known[person].extract_sidebar_links():
+                    neighbor = self.wiki.resolve(link)
+                    if neighbor in people and neighbor not in side["parents"]:
+                        side["parents"][neighbor] = person
+                        side["depths"][neighbor] = side["depths"][person] + 1
+                        frontier.append(neighbor)
+            side["frontier"] = frontier
+
+            # The sides meet on a shared person or across a link between a
+            # newly reached person and the other side, in either direction
+            candidates = []
+            for person in frontier:
+                if person in other["parents"]:
+                    candidates.append((person, person, 0))
+                for link in known[person].extract_sidebar_links():
+                    neighbor = self.wiki.resolve(link)
+                    if neighbor in other["parents"] and neighbor != person:
+                        candidates.append((person, neighbor, 1))
+            reached = set(frontier)
+            for neighbor in other["frontier"]:
+                for link in known[neighbor].extract_sidebar_links():
+                    person = self.wiki.resolve(link)
+                    if person in reached and person != neighbor:
+                        candidates.append((person, neighbor, 1))
+            for person, neighbor, step in candidates:
+                length = side["depths"][person] + step + other["depths"][neighbor]
+                if best is None or length < best[0]:
+                    best = (length, person, neighbor) if side is sides[0] else (length, neighbor, person)
+
+        if best is None:
+            return None
+
+        _, meeting_source, meeting_target = best
+        path = self._chain(sides[0]["parents"], meeting_source)
+        path.reverse()
+        if meeting_target == meeting_source:
+            meeting_target = sides[1]["parents"][meeting_target]
+        path.extend(self._chain(sides[1]["parents"], meeting_target))
+
+        edges = []
+        for first, second in zip(path, path[1:]):
+            for start, end in ((first, second), (second, first)):
+                labels = self._link_labels(known[start], end)
+                if labels is not None:
+                    edges.append((start, end, {"labels": json.dumps(labels)}))
+
+        with self.lock:
+            self.version += 1
+            for person in path:
+                self.graph.add_node(person)
+                self.pages[person] = known[person]
+                self.portraits_checked.add(person)
+            self.graph.add_edges_from(edges)
+            self.user_added.update((source, target))
+            self._own(source, path)
+            self._own(target, path)
+        self.update_portraits()
+        return path
+
+    # Looks up portraits in bulk for the people in the graph that have none and
+    # did not come through the combined page query, which already asks for
+    # them. Returns how many were found
+    @tracer.traced("network.update_portraits")
+    def update_portraits(self):
+        with self.lock:
+            titles = [
+                title
+                for title in self.graph
+                if title not in self.portraits_checked and self.get_page(title).image is None
+            ]
+        if not titles:
+            return 0
+        images = self.wiki.update_portraits(titles)
+
+        with self.lock:
+            self.portraits_checked.update(titles)
+            for title, image in images.items():
+                if title in self.pages:
+                    self.pages[title].image = image
+            if images:
+                self.version += 1
+        return len(images)
+
+    # The person and its parents up to the start of the search
+    def _chain(self, parents, person):
+        chain = []
+        while person is not None:
+            chain.append(person)
+            person = parents[person]
+        return chain
+
+    # Infobox fields in which the source person links to the target, also
+    # through aliases of the target
+    def link_labels(self, source, target):
+        with self.lock:
+            page = self.pages.get(source)
+            if page is None:
+                return []
+            return self._link_labels(page, target) or []
+
+    # Fields of the links on page that lead to title, or None if none does
+    def _link_labels(self, page, title):
+        labels = None
+        for link in page.extract_sidebar_links():
+            if self.wiki.resolve(link) == title:
+                labels = (labels or []) + page.extract_sidebar_link_info(link)
+        return labels
+
+    # Removing a seed drops its claim on the nodes it brought in and deletes
+    # the ones no other seed still holds, whatever depth says. Any other node
+    # is removed with the nodes it links to up to depth levels
     def remove_person(self, title, depth=0):
+        title = self.wiki.resolve_titles([title])[0]
+        with self.lock:
+            return self._remove_person(title, depth)
+
+    def _remove_person(self, title, depth):
         if not self.graph.has_node(title):
             return False
-        people = self.graph.neighbors(title)
-        self.graph.remove_node(title)
+        self.version += 1
+        if title in self.owned:
+            removed = self._release(title)
+            self.user_added.discard(title)
+        else:
+            removed = self._successors(title, depth)
 
-        for level in range(depth):
-            new_people = []
-            for person in people:
-                if not self.graph.has_node(person):
-                    continue
-                neighbors = self.graph.neighbors(person)
-                self.graph.remove_node(person)
-                new_people.extend(neighbors)
+        touched = set()
+        removed = deque(removed)
+        while removed:
+            person = removed.popleft()
+            if not self.graph.has_node(person):
+                continue
+            touched.update(nx.all_neighbors(self.graph, person))
+            self.graph.remove_node(person)
+            self.pages.pop(person, None)
+            self.user_added.discard(person)
+            self.portraits_checked.discard(person)
+            removed.extend(self._forget(person))
+        self.relayout.update(person for person in touched if self.graph.has_node(person))
+        return True
+
+    # owners maps every node to the seeds that brought it in and owned is the
+    # same relation by seed. Both only change through _own, _release and
+    # _forget so they always agree
+    def _own(self, seed, nodes):
+        owned = self.owned.setdefault(seed, set())
+        for node in nodes:
+            owned.add(node)
+            self.owners.setdefault(node, set()).add(seed)
 
-            people = new_people
+    # Drops the seed's claims and returns the nodes left without an owner
+    def _release(self, seed):
+        orphans = []
+        for node in self.owned.pop(seed, ()):
+            seeds = self.owners.get(node)
+            if seeds is None:
+                continue
+            seeds.discard(seed)
+            if not seeds:
+                del self.owners[node]
+                orphans.append(node)
+        return orphans
 
-        return True
+    # Removes a deleted node from the index. A deleted seed releases its
+    # claims too; returns the nodes that leaves without an owner
+    def _forget(self, node):
+        for seed in self.owners.pop(node, ()):
+            if seed != node:
+                self.owned[seed].discard(node)
+        return self._release(node)
+
+    # The node and the nodes it links to up to depth levels away
+    def _successors(self, title, depth):
+        found = {title: 0}
+        queue = deque([title])
+        while queue:
+            node = queue.popleft()
+            if found[node] == depth:
+                continue
+            for neighbor in self.graph.successors(node):
+                if neighbor not in found:
+                    found[neighbor] = found[node] + 1
+                    queue.append(neighbor)
+        return list(found)
+
+    # Pages of the people among titles. The network keeps its own references
+    # so the shared cache can evict pages that are still in the graph
+    def _extract_people(self, titles):
+        pages = self.wiki.extract_pages(titles)
+        return {title: page for title, page in pages.items() if page.is_person()}
+
+    # The graph as networkx for algorithms, converted at most once per version
+    # when the compact backend is used. The copy is dropped again once a
+    # render or clustering is done with it, so only the compact graph stays
+    def to_networkx(self):
+        if not self.compact:
+            return self.graph
+        version, graph = self.networkx_graph
+        if version != self.version:
+            graph = self.graph.to_networkx()
+            self.networkx_graph = (self.version, graph)
+        return graph
+
+    def _drop_networkx(self):
+        self.networkx_graph = (None, None)
+
+    # Bytes the graph takes as networkx and as the compact representation.
+    # With the compact backend, a networkx copy still held counts against it
+    def memory_report(self):
+        if self.compact:
+            compact, graph = self.graph, self.graph.to_networkx()
+            held = self.networkx_graph[1]
+        else:
+            compact, graph = CompactGraph(), self.graph
+            for node in graph:
+                compact.add_node(node)
+            compact.add_edges_from(graph.edges(data=True))
+            held = None
+
+        compact_size = compact.memory_usage()
+        if held is not None:
+            compact_size += networkx_memory_usage(held)
+        networkx_size = networkx_memory_usage(graph)
+        return {"networkx": networkx_size, "compact": compact_size, "saved": networkx_size - compact_size}
 
     def cluster_communities(self):
-        return nx.community.louvain_communities(self.graph, seed=8)
+        with self.lock:
+            try:
+                return self._cluster_communities()
+            finally:
+                self._drop_networkx()
+
+    def _cluster_communities(self):
+        self.communities.update(self.to_networkx(), self.version, self.relayout)
+        return list(self.communities.communities().values())
+
+    # Hues spread by the golden ratio so a cluster keeps its color no matter
+    # how many other clusters there are
+    def _cluster_color(self, cluster_id):
+        hue = (cluster_id * 0.618033988749895) % 1
+        return [y * 255 for y in colorsys.hsv_to_rgb(hue, 0.5, 0.5)]
 
-    def _n_colors(self, n):
-        HSV_tuples = [(x * 1.0 / n, 0.5, 0.5) for x in range(n)]
-        RGB_tuples = list(map(lambda x: [y * 255 for y in colorsys.hsv_to_rgb(*x)], HSV_tuples))
-        return RGB_tuples
+    # A provisional render runs only a few layout steps so levels can be shown
+    # as they arrive; settle relaxes those nodes properly afterwards
+    @tracer.traced("network.to_ctyoscape")
+    def to_ctyoscape(self, provisional=False):
+        graph = self.to_networkx()
+        positions = self._update_layout(graph, provisional)
 
-    def to_ctyoscape(self):
-        label_fix = nx.relabel_nodes(self.graph, lambda x: hash(x) % 2**sys.hash_info.width)
+        with tracer.span("network.serialize"):
+            cytoscape_json = nx.cytoscape_data(graph)
 
-        positions = nx.nx_pydot.graphviz_layout(label_fix, prog="sfdp")
-        cytoscape_json = nx.cytoscape_data(self.graph)
+            for node in cytoscape_json["elements"]["nodes"]:
+                name = node["data"]["name"]
+                pos = positions[name]
+                page = self.get_page(name)
+                node["position"] = {"x": pos[0], "y": pos[1]}
 
-        for node in cytoscape_json["elements"]["nodes"]:
-            name = node["data"]["name"]
-            pos = positions[hash(name) % 2**sys.hash_info.width]
-            page = self.get_page(name)
-            node["position"] = {"x": pos[0] * 3, "y": pos[1] * 3}
+                node["data"]["size"] = 120 if name in self.user_added else 30
+                if page.image is not None:
+                    node["data"]["url"] = self._portrait(page, node["data"]["size"])
 
-            if page.image is not None:
-                node["data"]["url"] = page.image
-            node["data"]["size"] = 120 if page.user_added else 30
+            for edge in cytoscape_json["elements"]["edges"]:
+                edge["data"]["id"] = edge["data"]["source"] + " -> " + edge["data"]["target"]
 
         return cytoscape_json["elements"]
 
-    def to_ctyoscape_cluster(self):
-        cytoscape = self.to_ctyoscape()
-        nodes = cytoscape["nodes"]
-        clusters = self.cluster_communities()
-        colors = self._n_colors(len(clusters))
-        cluster_map = {}
+    def _portrait(self, page, size):
+        if self.portrait_url is None:
+            return page.image
+        return self.portrait_url(page.image, size)
 
-        for i, cluster in enumerate(clusters):
-            cluster_map.update(dict.fromkeys(cluster, i))
+    def _update_layout(self, graph, provisional):
+        with tracer.span("network.layout"):
+            iterations = self.provisional_iterations if provisional else None
+            positions = self.layout.update(graph, self.version, self.relayout, iterations)
+            if provisional:
+                self.provisional.update(self.layout.moved)
+        return positions
 
-        for node in nodes:
-            name = node["data"]["name"]
-            node["data"]["color"] = colors[cluster_map[name]]
+    @tracer.traced("network.to_ctyoscape_cluster")
+    def to_ctyoscape_cluster(self, provisional=False):
+        with self.lock:
+            try:
+                return self._to_ctyoscape_cluster(provisional)
+            finally:
+                self._drop_networkx()
+
+    # Past lod_threshold people the graph is drawn at a level of detail that
+    # keeps it under element_limit elements, see _to_ctyoscape_lod
+    def _to_ctyoscape_cluster(self, provisional):
+        graph = self.to_networkx()
+        self.lod = graph.number_of_nodes() > self.lod_threshold
+        if self.lod:
+            positions = self._update_layout(graph, provisional)
+            with tracer.span("network.communities"):
+                cluster_map = self.communities.update(graph, self.version, self.relayout)
+            self.relayout = set()
+            with tracer.span("network.serialize"):
+                cytoscape = self._to_ctyoscape_lod(graph, positions, cluster_map)
+        else:
+            self.centroids = {}
+            cytoscape = self.to_ctyoscape(provisional)
+            with tracer.span("network.communities"):
+                cluster_map = self.communities.update(graph, self.version, self.relayout)
+            self.relayout = set()
+
+            for node in cytoscape["nodes"]:
+                name = node["data"]["name"]
+                node["data"]["color"] = self._cluster_color(cluster_map[name])
 
+        with tracer.span("network.diff"):
+            self._log_changes(cytoscape)
         return cytoscape
 
+    # Each community is drawn as one supernode sized by its member count, and
+    # the edges between two clusters as one edge weighted by how many links it
+    # stands for. Clusters that were clicked, are zoomed into or are too small
+    # to be worth collapsing are drawn as their members while they fit
+    def _to_ctyoscape_lod(self, graph, positions, cluster_map):
+        members = {}
+        for node in graph:
+            members.setdefault(cluster_map[node], []).append(node)
+        self.centroids = {}
+        for cluster, cluster_nodes in members.items():
+            xs, ys = zip(*(positions[node] for node in cluster_nodes))
+            self.centroids[cluster] = (sum(xs) / len(xs), sum(ys) / len(ys), len(cluster_nodes))
+        shown = self._shown_clusters(graph, members)
+
+        nodes = []
+        drawn_as = {}
+        for cluster, cluster_nodes in members.items():
+            color = self._cluster_color(cluster)
+            if cluster in shown:
+                for name in cluster_nodes:
+                    drawn_as[name] = name
+                    data = {"id": name, "value": name, "name": name, "color": color}
+                    page = self.get_page(name)
+                    data["size"] = 120 if name in self.user_added else 30
+                    if page.image is not None:
+                        data["url"] = self._portrait(page, data["size"])
+                    x, y = positions[name]
+                    nodes.append({"data": data, "position": {"x": x, "y": y}})
+                continue
+
+            supernode = "cluster:%d" % cluster
+            drawn_as.update(dict.fromkeys(cluster_nodes, supernode))
+            hub = max(cluster_nodes, key=lambda node: (node in self.user_added, graph.degree(node)))
+            x, y, count = self.centroids[cluster]
+            data = {
+                "id": supernode,
+                "name": "%s and %d others" % (hub, count - 1),
+                "cluster": cluster,
+                "members": count,
+                "size": min(400, 30 + 12 * math.sqrt(count)),
+                "color": color,
+            }
+            nodes.append({"data": data, "position": {"x": x, "y": y}})
+
+        edges = []
+        weights = Counter()
+        for source, target, data in graph.edges(data=True):
+            drawn_source, drawn_target = drawn_as[source], drawn_as[target]
+            if drawn_source == source and drawn_target == target:
+                edges.append({"data": dict(data, source=source, target=target, id=source + " -> " + target)})
+            elif drawn_source != drawn_target:
+                weights[min(drawn_source, drawn_target), max(drawn_source, drawn_target)] += 1
+
+        room = max(0, self.element_limit - len(nodes) - len(edges))
+        for (source, target), weight in weights.most_common(room):
+            data = {"id": source + " -- " + target, "source": source, "target": target, "weight": weight}
+            edges.append({"data": data})
+        return {"nodes": nodes, "edges": edges}
+
+    # Clicked clusters (latest first), then the ones in view, then the small
+    # ones, as long as their members and links fit in element_limit next to
+    # a supernode for every other cluster
+    def _shown_clusters(self, graph, members):
+        small = [cluster for cluster, nodes in members.items() if len(nodes) < self.lod_cluster_minimum]
+        used = len(members)
+        shown = set()
+        for cluster in [*reversed(self.expanded), *self.in_view, *small]:
+            if cluster in shown or cluster not in members:
+                continue
+            cost = len(members[cluster]) - 1 + sum(degree for _, degree in graph.degree(members[cluster]))
+            if used + cost <= self.element_limit:
+                shown.add(cluster)
+                used += cost
+        return shown
+
+    # Draws a collapsed cluster as its members from now on
+    def expand_cluster(self, cluster_id):
+        with self.lock:
+            if cluster_id in self.expanded:
+                self.expanded.remove(cluster_id)
+            self.expanded.append(cluster_id)
+            self.version += 1
+
+    # Clusters centered inside the visible extent ({x1, y1, x2, y2}) are drawn
+    # as their members once they hold at most lod_threshold people together,
+    # nearest to the middle first. Returns whether that changed
+    def set_viewport(self, extent):
+        with self.lock:
+            in_view = []
+            if extent and self.centroids:
+                middle = ((extent["x1"] + extent["x2"]) / 2, (extent["y1"] + extent["y2"]) / 2)
+                inside = [
+                    (math.hypot(x - middle[0], y - middle[1]), cluster, count)
+                    for cluster, (x, y, count) in self.centroids.items()
+                    if count >= self.lod_cluster_minimum
+                    and extent["x1"] <= x <= extent["x2"]
+                    and extent["y1"] <= y <= extent["y2"]
+                ]
+                if sum(count for _, _, count in inside) <= self.lod_threshold:
+                    in_view = [cluster for _, cluster, _ in sorted(inside)]
+            if set(in_view) == set(self.in_view):
+                return False
+            self.in_view = in_view
+            self.version += 1
+            return True
+
+    def cluster_members(self, cluster_id):
+        with self.lock:
+            return [node for node, cluster in self.communities.partition.items() if cluster == cluster_id]
+
+    # Queues the provisionally placed nodes for a full relaxation in a new
+    # version. Returns whether there was anything to settle
+    def settle(self):
+        with self.lock:
+            if not self.provisional:
+                return False
+            self.relayout.update(node for node in self.provisional if self.graph.has_node(node))
+            self.provisional = set()
+            self.version += 1
+            return True
+
+    # Records which elements were added, removed or changed (moved or
+    # recolored) compared to the last emitted elements
+    def _log_changes(self, cytoscape):
+        elements = {}
+        for group, group_elements in cytoscape.items():
+            for element in group_elements:
+                elements[element["data"]["id"]] = (group, element)
+
+        for element_id, (group, element) in elements.items():
+            old = self.elements.get(element_id)
+            if old is None:
+                self.change_log.append((self.version, group, None, element))
+            elif old[1] != element:
+                self.change_log.append((self.version, group, old[1], element))
+        for element_id, (group, old) in self.elements.items():
+            if element_id not in elements:
+                self.change_log.append((self.version, group, old, None))
+        self.elements = elements
+
+        while len(self.change_log) > self.log_limit:
+            self.log_start = self.change_log.popleft()[0]
+
+    # Changes as (group, old element, new element) since the elements of a
+    # version were emitted, or None when the log no longer reaches back that far.
+    # The one client of the log already has everything up to version, so those
+    # entries are dropped
+    def changes_since(self, version):
+        if version is None or version < self.log_start or version > self.version:
+            return None
+        while self.change_log and self.change_log[0][0] <= version:
+            self.change_log.popleft()
+        self.log_start = version
+        return [(group, old, new) for logged, group, old, new in self.change_log]
+
     def get_page(self, title):
-        return self.wiki.people_pages[title]
+        return self.pages[title]
@@ -0,0 +1,175 @@
+import sys
+import os
+import json
+import time
+import math
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.page import Page
+from famous_people_network.wiki import Wiki
+from famous_people_network.page_store import PageStore
+from famous_people_network.page_cache import PageCache
+from famous_people_network.http_client import ApiError
+from famous_people_network.people_network import PeopleNetwork
+
+worker_wiki = None
+
+
+def read_seeds(path):
+    with open(path, encoding="utf-8") as file:
+        seeds = [line.strip() for line in file]
+    return list(dict.fromkeys(seed for seed in seeds if seed and not seed.startswith("#")))
+
+
+# Runs in the worker processes. Each has its own page cache in front of the
+# shared store, so pages one worker saved are not fetched again by another
+def start_worker(api, store_path):
+    global worker_wiki
+    Wiki.url = api
+    worker_wiki = Wiki(store=PageStore(store_path), cache=PageCache())
+
+
+def crawl_seeds(seeds, depth):
+    network = PeopleNetwork(wiki=worker_wiki)
+    failed = []
+    for seed in seeds:
+        try:
+            network.add_person(seed, depth)
+        except ApiError as error:
+            failed.append((seed, str(error)))
+
+    aliases = {}
+    for page in network.pages.values():
+        for link in page.extract_sidebar_links():
+            target = worker_wiki.resolve(link)
+            if target != link:
+                aliases[link] = target
+
+    return {
+        "failed": failed,
+        "user_added": list(network.user_added),
+        "owned": {seed: list(nodes) for seed, nodes in network.owned.items()},
+        "aliases": aliases,
+        "pages": [
+            (title, page.sidebar, page.summary, page.image, page.revision, page.fetched)
+            for title, page in network.pages.items()
+        ],
+    }
+
+
+# Expands every seed to depth across a process pool and merges the pages the
+# workers found into one network.
+# Seeds are resolved up front so aliases of one person are crawled once, and
+# neighboring seeds go to the same worker so they share its page cache
+class PreCrawler:
+    def __init__(self, store_path, workers=None, chunks_per_worker=4, compact=False):
+        self.store_path = store_path
+        self.workers = workers or os.cpu_count()
+        self.chunks_per_worker = chunks_per_worker
+        self.compact = compact
+        self.missing = []
+        self.failed = []
+
+    def crawl(self, seeds, depth):
+        wiki = Wiki(store=PageStore(self.store_path), cache=PageCache())
+        pages = {title: page for title, page in wiki.extract_pages(seeds).items() if page.is_person()}
+        self.missing = [seed for seed in seeds if wiki.resolve(seed) not in pages]
+        people = list(dict.fromkeys(wiki.resolve(seed) for seed in seeds if wiki.resolve(seed) in pages))
+
+        network = PeopleNetwork(wiki=wiki, compact=self.compact)
+        size = max(1, math.ceil(len(people) / (self.workers * self.chunks_per_worker)))
+        chunks = [people[i : i + size] for i in range(0, len(people), size)]
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=start_worker,
+            initargs=(Wiki.url, self.store_path),
+        ) as executor:
+            futures = [executor.submit(crawl_seeds, chunk, depth) for chunk in chunks]
+            for future in as_completed(futures):
+                self._merge(network, future.result())
+        self._link(network)
+        return network
+
+    # Overlapping neighborhoods come back from several workers; a page is the
+    # same whichever worker fetched it, so the first one is kept
+    def _merge(self, network, result):
+        self.failed.extend(result["failed"])
+        network.wiki.cache.update_aliases(result["aliases"])
+        for title, sidebar, summary, image, revision, fetched in result["pages"]:
+            if title in network.pages:
+                continue
+            page = Page(title=title, sidebar=sidebar, summary=summary, revision=revision)
+            page.image = image
+            page.fetched = fetched
+            network.pages[title] = page
+            network.portraits_checked.add(title)
+            network.graph.add_node(title)
+        network.user_added.update(result["user_added"])
+        for seed, nodes in result["owned"].items():
+            network._own(seed, nodes)
+        network.version += 1
+
+    # Edges come from the merged pages rather than the workers' graphs, which
+    # miss the links between people that different workers reached
+    def _link(self, network):
+        edges = []
+        for title, page in network.pages.items():
+            targets = {}
+            for link in page.extract_sidebar_links():
+                target = network.wiki.resolve(link)
+                if target in network.pages:
+                    targets.setdefault(target, []).extend(page.extract_sidebar_link_info(link))
+            edges.extend((title, target, {"labels": json.dumps(labels)}) for target, labels in targets.items())
+        network.graph.add_edges_from(edges)
+        network.version += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand a list of seed people into a network snapshot")
+    parser.add_argument("seeds", help="text file with one person per line")
+    parser.add_argument("snapshot", help="snapshot file to write")
+    parser.add_argument("--depth", type=int, default=2, help="levels to expand around every seed")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--store",
+        default=os.path.join(os.path.dirname(__file__), "..", "cache", "pages.db"),
+        help="page store shared by the workers",
+    )
+    parser.add_argument("--api", default=Wiki.url, help="api.php to crawl")
+    parser.add_argument("--compact", action="store_true", help="merge into the compact graph backend")
+    parser.add_argument("--no-layout", action="store_true", help="leave layout and clusters to the app")
+    args = parser.parse_args()
+
+    Wiki.url = args.api
+    seeds = read_seeds(args.seeds)
+    crawler = PreCrawler(args.store, workers=args.workers, compact=args.compact)
+    start = time.time()
+    network = crawler.crawl(seeds, args.depth)
+    crawled = time.time()
+    if not args.no_layout:
+        network.to_ctyoscape_cluster()
+    network.save_snapshot(args.snapshot)
+
+    for seed in crawler.missing:
+        print("not a person:", seed, file=sys.stderr)
+    for seed, error in crawler.failed:
+        print("failed:", seed, error, file=sys.stderr)
+    print(
+        "%d seeds, %d people, %d edges; crawled in %.1fs, written in %.1fs"
+        % (
+            len(seeds),
+            network.graph.number_of_nodes(),
+            network.graph.number_of_edges(),
+            crawled - start,
+            time.time() - crawled,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
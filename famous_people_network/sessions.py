@@ -0,0 +1,35 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+# Gives every browser session its own network. Sessions idle for longer than
+# idle seconds are dropped, as are the least recently used ones past limit
+class SessionRegistry:
+    def __init__(self, factory, idle=6 * 60 * 60, limit=200):
+        self.factory = factory
+        self.idle = idle
+        self.limit = limit
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.time()
+        with self.lock:
+            if session_id in self.sessions:
+                network, _ = self.sessions.pop(session_id)
+            else:
+                network = self.factory()
+            self.sessions[session_id] = (network, now)
+            self._evict(now)
+        return network
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def _evict(self, now):
+        while self.sessions:
+            session_id, (network, used) = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.limit and now - used <= self.idle:
+                break
+            del self.sessions[session_id]
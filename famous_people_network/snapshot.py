@@ -0,0 +1,254 @@
+import sys
+import os
+import json
+import mmap
+import zlib
+import struct
+import numpy as np
+import networkx as nx
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.page import Page
+from famous_people_network.compact_graph import CompactGraph
+
+MAGIC = b"FPNSNAP\0"
+FORMAT = 2
+# Format 1 has no owned section
+FORMATS = (1, 2)
+PREAMBLE = struct.Struct("<8sII")
+
+
+# Snapshot layout: magic, format and header length, a JSON header with the
+# small tables and section offsets, then 8 byte aligned sections:
+#   titles      utf-8 titles and their uint64 offsets
+#   edges       int32 source, target and label set code per edge
+#   positions   float64 x, y per node (nan when not laid out)
+#   clusters    int64 community per node (-1 when not clustered)
+#   flags       uint8 per node, 1 when added by the user
+#   owned       int32 seed and node per node a seed brought in
+#   pages       zlib compressed JSON page per node and their uint64 offsets
+def save(network, path):
+    graph = network.graph
+    if isinstance(graph, CompactGraph):
+        titles, indptr, targets, codes = graph.to_csr()
+        sources = np.repeat(np.arange(len(titles), dtype=np.int32), np.diff(indptr))
+        label_sets = [json.dumps([graph.fields[field] for field in key]) for key in graph.label_sets]
+    else:
+        titles = list(graph)
+        index = {title: i for i, title in enumerate(titles)}
+        label_ids = {}
+        edges = [
+            (index[source], index[target], label_ids.setdefault(labels, len(label_ids)))
+            for source, target, labels in graph.edges(data="labels", default="[]")
+        ]
+        edges = np.array(edges, dtype=np.int32).reshape(-1, 3)
+        sources, targets, codes = edges[:, 0], edges[:, 1], edges[:, 2]
+        label_sets = list(label_ids)
+
+    positions = np.full((len(titles), 2), np.nan)
+    clusters = np.full(len(titles), -1, dtype=np.int64)
+    for i, title in enumerate(titles):
+        if title in network.layout.positions:
+            positions[i] = network.layout.positions[title]
+        clusters[i] = network.communities.partition.get(title, -1)
+    flags = np.fromiter((title in network.user_added for title in titles), dtype=np.uint8, count=len(titles))
+    index = {title: i for i, title in enumerate(titles)}
+    owned = np.array(
+        [(index[seed], index[node]) for seed, nodes in network.owned.items() for node in nodes if node in index],
+        dtype=np.int32,
+    ).reshape(-1, 2)
+
+    encoded_titles = [title.encode("utf-8") for title in titles]
+    pages = [
+        zlib.compress(
+            json.dumps([page.sidebar, page.summary, page.image, page.revision, page.fetched]).encode("utf-8")
+        )
+        for page in (network.get_page(title) for title in titles)
+    ]
+
+    sections = {
+        "title_offsets": _offsets(encoded_titles).tobytes(),
+        "titles": b"".join(encoded_titles),
+        "sources": np.ascontiguousarray(sources, dtype=np.int32).tobytes(),
+        "targets": np.ascontiguousarray(targets, dtype=np.int32).tobytes(),
+        "codes": np.ascontiguousarray(codes, dtype=np.int32).tobytes(),
+        "positions": positions.tobytes(),
+        "clusters": clusters.tobytes(),
+        "flags": flags.tobytes(),
+        "owned": owned.tobytes(),
+        "page_offsets": _offsets(pages).tobytes(),
+        "pages": b"".join(pages),
+    }
+    header = {
+        "nodes": len(titles),
+        "edges": len(sources),
+        "label_sets": label_sets,
+        "compact": isinstance(graph, CompactGraph),
+        "version": network.version,
+        "next_cluster": network.communities.next_id,
+        "quality": network.communities.quality,
+        "sections": {},
+    }
+
+    # Offsets depend on the header length, which depends on the offsets
+    offset = 0
+    while True:
+        encoded = json.dumps(header).encode("utf-8")
+        start = _align(PREAMBLE.size + len(encoded))
+        if start == offset:
+            break
+        offset = start
+        position = start
+        for name, data in sections.items():
+            header["sections"][name] = [position, len(data)]
+            position = _align(position + len(data))
+
+    with open(path, "wb") as file:
+        file.write(PREAMBLE.pack(MAGIC, FORMAT, len(encoded)))
+        file.write(encoded)
+        for name, data in sections.items():
+            file.seek(header["sections"][name][0])
+            file.write(data)
+
+
+# Replaces the network's graph, pages, layout and communities with the
+# snapshot. The file is memory mapped and pages are only decompressed when
+# something asks for them
+def load(network, path):
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, header_length = PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC or version not in FORMATS:
+        raise ValueError(path + " is not a people network snapshot")
+    header = json.loads(buffer[PREAMBLE.size : PREAMBLE.size + header_length])
+
+    def section(name, dtype):
+        start, length = header["sections"][name]
+        return np.frombuffer(buffer, dtype=dtype, count=length // np.dtype(dtype).itemsize, offset=start)
+
+    title_offsets = section("title_offsets", np.uint64)
+    titles_start = header["sections"]["titles"][0]
+    titles = [
+        buffer[titles_start + int(start) : titles_start + int(end)].decode("utf-8")
+        for start, end in zip(title_offsets[:-1], title_offsets[1:])
+    ]
+    sources = section("sources", np.int32)
+    targets = section("targets", np.int32)
+    codes = section("codes", np.int32)
+
+    if header["compact"] or network.compact:
+        graph = CompactGraph()
+        for title in titles:
+            graph.add_node(title)
+        label_sets = [json.loads(labels) for labels in header["label_sets"]]
+        for source, target, code in zip(sources.tolist(), targets.tolist(), codes.tolist()):
+            graph.add_edge(titles[source], titles[target], label_sets[code])
+    else:
+        graph = nx.DiGraph()
+        graph.add_nodes_from(titles)
+        label_sets = header["label_sets"]
+        graph.add_edges_from(
+            (titles[source], titles[target], {"labels": label_sets[code]})
+            for source, target, code in zip(sources.tolist(), targets.tolist(), codes.tolist())
+        )
+
+    positions = section("positions", np.float64).reshape(-1, 2)
+    clusters = section("clusters", np.int64)
+    flags = section("flags", np.uint8)
+    owned = section("owned", np.int32).reshape(-1, 2) if "owned" in header["sections"] else np.empty((0, 2))
+
+    with network.lock:
+        network.compact = isinstance(graph, CompactGraph)
+        network.graph = graph
+        network.networkx_graph = (None, None)
+        network.pages = LazyPages(buffer, header, titles)
+        network.user_added = {titles[i] for i in np.flatnonzero(flags).tolist()}
+        # Portraits were saved with the pages, so none are looked up again
+        network.portraits_checked = set(titles)
+        network.owned = {}
+        network.owners = {}
+        for seed, node in owned.tolist():
+            network._own(titles[seed], [titles[node]])
+        network.relayout = set()
+        network.provisional = set()
+        network.expanded = []
+        network.in_view = []
+
+        network.version = max(network.version, header["version"]) + 1
+        network.elements = {}
+        network.change_log.clear()
+        network.log_start = network.version
+
+        network.layout.reset()
+        network.layout.positions = {
+            titles[i]: (x, y) for i, (x, y) in enumerate(positions.tolist()) if x == x
+        }
+        network.layout.version = network.version if len(network.layout.positions) == len(titles) else None
+
+        network.communities.reset()
+        network.communities.partition = {
+            titles[i]: cluster for i, cluster in enumerate(clusters.tolist()) if cluster >= 0
+        }
+        network.communities.next_id = header["next_cluster"]
+        network.communities.quality = header["quality"]
+        if len(network.communities.partition) == len(titles):
+            network.communities.version = network.version
+
+
+# Title -> Page, decoding a page from the snapshot the first time it is asked
+# for. Pages added or removed later are kept like in a plain dict
+class LazyPages(dict):
+    def __init__(self, buffer, header, titles):
+        super().__init__()
+        self.buffer = buffer
+        self.start = header["sections"]["pages"][0]
+        start, length = header["sections"]["page_offsets"]
+        self.offsets = np.frombuffer(buffer, dtype=np.uint64, count=length // 8, offset=start)
+        self.index = {title: i for i, title in enumerate(titles)}
+
+    def __missing__(self, title):
+        page = self._decode(title, self.index.pop(title))
+        super().__setitem__(title, page)
+        return page
+
+    def _decode(self, title, i):
+        data = self.buffer[self.start + int(self.offsets[i]) : self.start + int(self.offsets[i + 1])]
+        sidebar, summary, image, revision, fetched = json.loads(zlib.decompress(data))
+        page = Page(title=title, sidebar=sidebar, summary=summary, revision=revision)
+        page.image = image
+        page.fetched = fetched
+        return page
+
+    # A page set or removed replaces the one in the snapshot for good
+    def __setitem__(self, title, page):
+        self.index.pop(title, None)
+        super().__setitem__(title, page)
+
+    def update(self, *args, **pages):
+        for title, page in dict(*args, **pages).items():
+            self[title] = page
+
+    def __contains__(self, title):
+        return super().__contains__(title) or title in self.index
+
+    def get(self, title, default=None):
+        return self[title] if title in self else default
+
+    def pop(self, title, *default):
+        if title in self.index:
+            return self._decode(title, self.index.pop(title))
+        return super().pop(title, *default)
+
+    def __len__(self):
+        return super().__len__() + len(self.index)
+
+
+def _offsets(chunks):
+    offsets = np.zeros(len(chunks) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+    return offsets
+
+
+def _align(position):
+    return (position + 7) // 8 * 8
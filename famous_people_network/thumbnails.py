@@ -0,0 +1,73 @@
+import io
+import os
+import sys
+import hashlib
+import threading
+from urllib.parse import urlsplit
+from PIL import Image, ImageOps
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from famous_people_network.http_client import HttpClient
+from famous_people_network.tracing import tracer
+
+
+# Portraits cropped and resized to the sizes nodes are drawn at, kept on disk
+# under the hash of their source URL and size so every session and restart
+# shares them. Only images from hosts are fetched
+class ThumbnailCache:
+    hosts = ("upload.wikimedia.org",)
+    sizes = (30, 120)
+
+    def __init__(self, directory, client=None):
+        self.directory = directory
+        self.client = client if client is not None else HttpClient()
+        self.locks = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def allowed(self, url, size):
+        parts = urlsplit(url or "")
+        return parts.scheme == "https" and parts.hostname in self.hosts and size in self.sizes
+
+    def path(self, url, size):
+        key = hashlib.sha256(("%d %s" % (size, url)).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key[:2], key + ".jpg")
+
+    # Path of the thumbnail, fetching and resizing the source the first time.
+    # Concurrent requests for the same thumbnail wait for one fetch
+    def get(self, url, size):
+        if not self.allowed(url, size):
+            raise ValueError("not a portrait url: " + str(url))
+        path = self.path(url, size)
+        if os.path.exists(path):
+            tracer.count("thumbnails.hits")
+            return path
+
+        with self.lock:
+            lock = self.locks.setdefault(path, threading.Lock())
+        with lock:
+            if not os.path.exists(path):
+                tracer.count("thumbnails.misses")
+                with tracer.span("thumbnails.fetch"):
+                    response = self.client.session.get(url, timeout=self.client.timeout)
+                    response.raise_for_status()
+                with tracer.span("thumbnails.resize"):
+                    data = self._resize(response.content, size)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temporary = path + ".%d.tmp" % threading.get_ident()
+                with open(temporary, "wb") as file:
+                    file.write(data)
+                os.replace(temporary, path)
+        with self.lock:
+            self.locks.pop(path, None)
+        return path
+
+    # Square center crop, like the cover fit nodes draw portraits with
+    def _resize(self, content, size):
+        with Image.open(io.BytesIO(content)) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=85, optimize=True)
+        return output.getvalue()
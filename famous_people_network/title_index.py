@@ -0,0 +1,73 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+# Prefix index over person titles for type-ahead. Sorted lists hold the
+# casefolded title and every word start in it, so "einst" finds "Albert
+# Einstein". New titles go to a small list of their own that is only merged
+# into the large one once it has grown, so adding a few titles does not
+# re-sort everything. Past capacity the titles seen longest ago are dropped;
+# searches skip their keys until enough piled up to be worth a rebuild
+class TitleIndex:
+    def __init__(self, capacity=50000, scan=200, merge_ratio=0.125):
+        self.capacity = capacity
+        self.scan = scan
+        self.merge_ratio = merge_ratio
+        self.keys = []
+        self.recent = []
+        self.titles = OrderedDict()
+        self.evicted = 0
+        self.unsorted = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, titles):
+        with self.lock:
+            for title in titles:
+                if title in self.titles:
+                    self.titles.move_to_end(title)
+                    continue
+                self.titles[title] = None
+                key = title.casefold()
+                self.recent.append((key, 0, title))
+                for i, character in enumerate(key):
+                    if character in " (-" and i + 1 < len(key) and key[i + 1] not in " (-":
+                        self.recent.append((key[i + 1 :], 1, title))
+                self.unsorted = True
+            while len(self.titles) > self.capacity:
+                self.titles.popitem(last=False)
+                self.evicted += 1
+            if self.evicted > self.capacity * self.merge_ratio:
+                keys = self.keys + self.recent
+                self.keys = sorted(set(entry for entry in keys if entry[2] in self.titles))
+                self.recent = []
+                self.evicted = 0
+                self.unsorted = False
+
+    # Titles starting with the prefix first, then the ones with a word that
+    # does, shorter titles first within each
+    def search(self, prefix, limit=10):
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        with self.lock:
+            if self.unsorted:
+                if len(self.recent) > max(1000, len(self.keys) * self.merge_ratio):
+                    self.keys.extend(self.recent)
+                    self.keys.sort()
+                    self.recent = []
+                else:
+                    self.recent.sort()
+                self.unsorted = False
+            found = {}
+            for keys in (self.keys, self.recent):
+                for i in range(bisect_left(keys, (prefix,)), len(keys)):
+                    key, rank, title = keys[i]
+                    if not key.startswith(prefix) or len(found) >= self.scan:
+                        break
+                    if title in self.titles:
+                        found[title] = min(rank, found.get(title, rank))
+        return sorted(found, key=lambda title: (found[title], len(title), title))[:limit]
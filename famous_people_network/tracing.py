@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+import functools
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Span:
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+# Total time, call count and slowest call per span name, plus plain counters.
+# Disabled, span() hands out one shared no-op and traced functions are called
+# straight through, so leaving the instrumentation in costs a flag check
+class Tracer:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.spans = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def traced(self, name):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = [0, 0.0, 0.0]
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "spans": {
+                    name: {"count": count, "seconds": seconds, "max": slowest}
+                    for name, (count, seconds, slowest) in self.spans.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    # What happened between two snapshots. Spans from concurrent work in other
+    # sessions are included too
+    def since(self, before):
+        after = self.snapshot()
+        spans = {}
+        for name, span in after["spans"].items():
+            old = before["spans"].get(name, {"count": 0, "seconds": 0.0})
+            if span["count"] > old["count"]:
+                spans[name] = {"count": span["count"] - old["count"], "seconds": span["seconds"] - old["seconds"]}
+        counters = {
+            name: value - before["counters"].get(name, 0)
+            for name, value in after["counters"].items()
+            if value != before["counters"].get(name, 0)
+        }
+        return {"spans": spans, "counters": counters}
+
+    def reset(self):
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+
+
+# FAMOUS_PEOPLE_TRACE=0 turns tracing off
+tracer = Tracer(enabled=os.environ.get("FAMOUS_PEOPLE_TRACE", "1") != "0")
+
+
+def merge_timings(*breakdowns):
+    spans = {}
+    counters = {}
+    for breakdown in breakdowns:
+        for name, span in breakdown["spans"].items():
+            merged = spans.setdefault(name, {"count": 0, "seconds": 0.0})
+            merged["count"] += span["count"]
+            merged["seconds"] += span["seconds"]
+        for name, value in breakdown["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+    return {"spans": spans, "counters": counters}
@@ -1,20 +1,90 @@
+import re
 import sys
 import os
-import requests
+import threading
+from collections import OrderedDict
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from famous_people_network.page import Page
+from famous_people_network.fetcher import Fetcher
+from famous_people_network.page_cache import PageCache
+from famous_people_network.title_index import TitleIndex
+from famous_people_network.tracing import tracer
 
 
 class Wiki:
     url = "https://en.wikipedia.org/w/api.php"
-
-    def __init__(self):
+    # Titles that are never people: years, decades, centuries, dates, lists
+    # and other namespaces
+    skip_pattern = re.compile(
+        r"^(\d{1,4}s?( BC| BCE| AD| CE)?"
+        r"|\d{1,2}(st|nd|rd|th)[ -]century( BC| BCE)?"
+        r"|(January|February|March|April|May|June|July|August|September|October|November|December) \d{1,2}"
+        r"|\d{1,2} (January|February|March|April|May|June|July|August|September|October|November|December)"
+        r"|List of .*|Lists of .*"
+        r"|(Category|File|Image|Template|Help|Wikipedia|Portal|Special|Talk|User):.*)$"
+    )
+    # Short descriptions that name a thing other than a person as their head
+    # word, like "City in Germany" or "1994 film by ..."
+    place_pattern = re.compile(
+        r"^(?:\S+ ){0,3}?(city|town|village|municipality|commune|capital|province|county|district|region"
+        r"|island|river|mountain|lake|building|university|college|school|company|corporation"
+        r"|organi[sz]ation|political party|band|album|song|single|film|television series|book|novel"
+        r"|newspaper|magazine|genus|species|language|award|treaty|ethnic group|ship|year|decade|century"
+        r"|disambiguation page|topics referred to by the same term)s?(?: in\b| of\b| on\b| by\b| from\b"
+        r"| based\b| located\b|,|$)",
+        re.IGNORECASE,
+    )
+    life_pattern = re.compile(r"\b(born|died)\b|\d{3,4}\s*[-\u2013]\s*\d{2,4}|\(\s*(c\.\s*)?\d{3,4}")
+
+    # Width of the portraits asked for, enough for the largest node
+    portrait_size = 240
+    classify_minimum = 20
+    classify_threshold = 0.25
+
+    def __init__(self, store=None, concurrency=4, offline=False, cache=None, classify=True):
         # maybe include language
-        self.people_pages = {}
-        self.visited_titles = set()
-
+        self.cache = cache if cache is not None else PageCache()
+        self.store = store
+        self.offline = offline
+        self.classify = classify
+        self.negative_rate = 0.5
+        self.titles = TitleIndex()
+        self.searches = OrderedDict()
+        self.search_capacity = 1000
+        self.search_lock = threading.Lock()
+        self.fetcher = Fetcher(concurrency=concurrency)
+
+    def resolve(self, title):
+        return self.cache.resolve(title)
+
+    # Canonical titles, following the aliases the cache knows and, for titles
+    # it has no page for, the ones in the store. Normalization and redirect
+    # are stored as separate hops, so found targets are looked up in turn
+    def resolve_titles(self, titles):
+        if self.store is not None:
+            lookup = [title for title in titles if self.resolve(title) not in self.cache]
+            for _ in range(3):
+                aliases = self.store.load_aliases(lookup) if lookup else {}
+                if not aliases:
+                    break
+                self.cache.update_aliases(aliases)
+                lookup = [title for title in dict.fromkeys(aliases.values()) if title not in self.cache]
+        return list(dict.fromkeys(self.resolve(title) for title in titles))
+
+    # Normalized and redirected titles the API answered with, kept in the
+    # cache and the store so later lookups resolve before fetching
+    def _record_aliases(self, query):
+        aliases = query.get("normalized", []) + query.get("redirects", [])
+        aliases = {alias["from"]: alias["to"] for alias in aliases}
+        if not aliases:
+            return
+        self.cache.update_aliases(aliases)
+        if self.store is not None:
+            self.store.save_aliases(aliases)
+
+    @tracer.traced("wiki.search")
     def search_wiki(self, title):
         params = {
             "action": "query",
@@ -24,10 +94,35 @@ class Wiki:
             "srsearch": title,
         }
 
-        data = requests.get(self.url, params=params).json()
+        data = self.fetcher.get(self.url, params)
         pages = data["query"]["search"]
         return pages
 
+    # People seen so far whose title or one of its words starts with text
+    def suggest(self, text, limit=10):
+        return self.titles.search(text, limit)
+
+    # Titles the search API finds for text, leaving out ones known not to be
+    # people. Answers are kept so repeating a search costs nothing
+    def search_people(self, text, limit=10):
+        key = text.strip().casefold()
+        with self.search_lock:
+            if key in self.searches:
+                self.searches.move_to_end(key)
+                return self.searches[key][:limit]
+
+        titles = [result["title"] for result in self.search_wiki(text.strip())]
+        titles = [
+            title
+            for title in titles
+            if not self.skip_pattern.match(title) and (title not in self.cache or self.cache.get(title) is not None)
+        ]
+        with self.search_lock:
+            self.searches[key] = titles
+            while len(self.searches) > self.search_capacity:
+                self.searches.popitem(last=False)
+        return titles[:limit]
+
     def extract_people(self, titles):
         if not isinstance(titles, list):
             titles = [titles]
@@ -38,172 +133,222 @@ class Wiki:
         return people
 
     # Visited pages that are not people are not included
+    @tracer.traced("wiki.extract_pages")
     def extract_pages(self, titles):
         if not isinstance(titles, list):
             titles = [titles]
 
-        pages = {}
-        unvisited = []
-
-        for title in titles:
-            if title in self.people_pages:
-                pages[title] = self.people_pages[title]
-            elif title not in self.visited_titles:
-                unvisited.append(title)
-
-        titles = unvisited
-
-        sidebars = self._extract_sidebars(titles)
-        summaries = self._extract_summaries(titles)
-        for title in set([*sidebars, *summaries]):
-            sidebar = sidebars[title] if title in sidebars else ""
-            summary = summaries[title] if title in summaries else ""
-            page = Page(title=title, sidebar=sidebar, summary=summary)
-
-            pages[title] = page
-            self.visited_titles.add(title)
-            if page.is_person():
-                self.people_pages[title] = page
+        titles = self.resolve_titles(titles)
+        pages, titles = self.cache.lookup(titles)
+        if self.store is not None and titles:
+            titles = self._load_stored(titles, pages)
+        self.titles.add(pages)
+        if self.offline:
+            # Anything the store does not know is not a person
+            self.cache.update(dict.fromkeys(titles))
+            return pages
+        # Up to one extracts batch costs a single full request anyway, and when
+        # nearly every title turns out to be a person the extra query is waste
+        if (
+            self.classify
+            and len(titles) > self.classify_minimum
+            and self.negative_rate >= self.classify_threshold
+        ):
+            titles = self._classify(titles)
+            cached, titles = self.cache.lookup(titles)
+            pages.update(cached)
+        if not titles:
+            return pages
+
+        batch = self._extract_batch(titles)
+        extracted = list(batch.values())
+        pages.update(batch)
+        # Missing pages are remembered as not being people too
+        known = dict.fromkeys(self.resolve(title) for title in titles)
+        known.update((title, page if page.is_person() else None) for title, page in batch.items())
+        self.cache.update(known)
+        self._observe(sum(page is None for page in known.values()), len(known))
+
+        if self.store is not None:
+            self.store.save(extracted)
+        self.titles.add(title for title, page in known.items() if page is not None)
         return pages
 
-    def _extract_sidebars(self, titles):
+    # Drops titles that are clearly not people using the title itself and one
+    # light pageprops/description query, and returns the rest. Rejected titles
+    # are cached and stored so they are never fetched in full
+    @tracer.traced("wiki.classify")
+    def _classify(self, titles):
+        negatives = [title for title in titles if self.skip_pattern.match(title)]
+        candidates = [title for title in titles if not self.skip_pattern.match(title)]
+        params = {
+            "action": "query",
+            "prop": "pageprops|description",
+            "ppprop": "disambiguation|wikibase-shortdesc",
+            "format": "json",
+            "redirects": 1,
+        }
+
+        people = []
+        for data in self.fetcher.query(self.url, params, candidates):
+            query = data["query"]
+            self._record_aliases(query)
+            for result in query["pages"].values():
+                title = result["title"]
+                props = result.get("pageprops", {})
+                description = result.get("description") or props.get("wikibase-shortdesc") or ""
+                if (
+                    "missing" in result
+                    or "invalid" in result
+                    or "disambiguation" in props
+                    or (self.place_pattern.match(description) and not self.life_pattern.search(description))
+                ):
+                    negatives.append(title)
+                else:
+                    people.append(title)
+
+        self._observe(len(negatives), len(titles))
+        tracer.count("wiki.classified_out", len(negatives))
+        self.cache.update(dict.fromkeys(negatives))
+        if self.store is not None and negatives:
+            self.store.save_negatives(negatives)
+        return list(dict.fromkeys(people))
+
+    # Running share of fetched titles that were not people
+    def _observe(self, negatives, total):
+        if total:
+            self.negative_rate = 0.7 * self.negative_rate + 0.3 * negatives / total
+
+    # Fills pages from the store and returns the titles that still need fetching
+    @tracer.traced("wiki.store")
+    def _load_stored(self, titles, pages):
+        fresh, stale = self.store.load(titles)
+
+        if stale and self.offline:
+            fresh.update((title, page) for title, (revision, page) in stale.items())
+            stale = {}
+
+        if stale:
+            revisions = self._extract_revisions(list(stale))
+            unchanged = [
+                title
+                for title, (revision, page) in stale.items()
+                if revision is not None and revisions.get(title) == revision
+            ]
+            if unchanged:
+                self.store.touch(unchanged)
+                fresh.update((title, stale[title][1]) for title in unchanged)
+
+        self.cache.update(fresh)
+        pages.update((title, page) for title, page in fresh.items() if page is not None)
+
+        return [title for title in titles if title not in fresh]
+
+    # One query per chunk for sidebar, summary and portrait. Continuations of
+    # the three props arrive in separate responses and are merged per title
+    @tracer.traced("wiki.fetch")
+    def _extract_batch(self, titles):
         if not isinstance(titles, list):
             titles = [titles]
-        session = requests.Session()
-        sidebars = {}
-        step = 50
-
-        for i in range(0, len(titles), step):
-            params = {
-                "action": "query",
-                "prop": "revisions",
-                "format": "json",
-                "rvprop": "content",
-                "rvslots": "main",
-                "rvsection": 0,
-                "redirects": 1,
-                "titles": "|".join(titles[i : i + step]),
-            }
-            data = session.get(self.url, params=params).json()
-            if "query" not in data:
-                return {}
-            pages = data["query"]["pages"]
-
-            for page in pages.values():
-                if "revisions" in page:
-                    title = page["title"]
-                    sidebars[title] = page["revisions"][0]["slots"]["main"]["*"]
-
-            while "continue" in data:
-                rvcontinue = data["continue"]["rvcontinue"]
-                params["rvcontinue"] = rvcontinue
-
-                data = session.get(url=self.url, params=params).json()
-                pages = data["query"]["pages"]
-
-                for page in pages.values():
-                    if "revisions" in page:
-                        title = page["title"]
-                        sidebars[title] = page["revisions"][0]["slots"]["main"]["*"]
+        pages = {}
+        params = {
+            "action": "query",
+            "prop": "revisions|extracts|pageimages",
+            "format": "json",
+            "rvprop": "content|ids",
+            "rvslots": "main",
+            "rvsection": 0,
+            "exintro": 0,
+            "exsentences": 5,
+            "explaintext": 0,
+            "exlimit": "max",
+            "pithumbsize": self.portrait_size,
+            "pilimit": "max",
+            "redirects": 1,
+        }
 
-        return sidebars
+        for data in self.fetcher.query(self.url, params, titles):
+            query = data["query"]
+            self._record_aliases(query)
+
+            for result in query["pages"].values():
+                title = result["title"]
+                if "revisions" in result:
+                    page = pages.setdefault(title, Page(title=title))
+                    page.sidebar = result["revisions"][0]["slots"]["main"]["*"]
+                    page.revision = result["revisions"][0]["revid"]
+                if "extract" in result:
+                    page = pages.setdefault(title, Page(title=title))
+                    page.summary = result["extract"]
+                if "thumbnail" in result:
+                    page = pages.setdefault(title, Page(title=title))
+                    page.image = result["thumbnail"]["source"]
+
+        tracer.count("wiki.pages_fetched", len(pages))
+        return pages
 
-    def _extract_summaries(self, titles):
+    def _extract_revisions(self, titles):
         if not isinstance(titles, list):
             titles = [titles]
-        session = requests.Session()
-        summaries = {}
-        step = 50
-
-        for i in range(0, len(titles), step):
-            params = {
-                "action": "query",
-                "prop": "extracts",
-                "format": "json",
-                "exintro": 0,
-                "exsentences": 5,
-                "explaintext": 0,
-                "redirects": 1,
-                "titles": "|".join(titles[i : i + step]),
-            }
-            data = session.get(self.url, params=params).json()
-            if "query" not in data:
-                return {}
-            pages = data["query"]["pages"]
-
-            for page in pages.values():
-                if "extract" in page:
-                    title = page["title"]
-                    summaries[title] = page["extract"]
-
-            while "continue" in data:
-                excontinue = data["continue"]["excontinue"]
-                params["excontinue"] = excontinue
-
-                data = session.get(url=self.url, params=params).json()
-                pages = data["query"]["pages"]
+        revisions = {}
+        params = {
+            "action": "query",
+            "prop": "info",
+            "format": "json",
+        }
 
-                for page in pages.values():
-                    if "extract" in page:
-                        title = page["title"]
-                        summaries[title] = page["extract"]
+        for data in self.fetcher.query(self.url, params, titles):
+            for page in data["query"]["pages"].values():
+                if "lastrevid" in page:
+                    revisions[page["title"]] = page["lastrevid"]
 
-        return summaries
+        return revisions
 
+    # Portrait URLs of titles in bulk, also kept in the cache and store.
+    # Titles without a portrait are left out
+    @tracer.traced("wiki.portraits")
     def update_portraits(self, titles):
         if not isinstance(titles, list):
             titles = [titles]
-        session = requests.Session()
-        step = 50
-
-        for i in range(0, len(titles), step):
-            params = {
-                "action": "query",
-                "prop": "pageimages",
-                "format": "json",
-                "pithumbsize": 500,
-                "titles": "|".join(titles[i : i + step]),
-            }
-            data = session.get(self.url, params=params).json()
-            if "query" not in data:
-                return
-            pages = data["query"]["pages"]
-
-            for page in pages.values():
+        images = {}
+        if self.offline:
+            return images
+        params = {
+            "action": "query",
+            "prop": "pageimages",
+            "format": "json",
+            "pithumbsize": self.portrait_size,
+            "pilimit": "max",
+            "redirects": 1,
+        }
+
+        for data in self.fetcher.query(self.url, params, self.resolve_titles(titles)):
+            self._record_aliases(data["query"])
+            for page in data["query"]["pages"].values():
                 if "thumbnail" in page:
                     title = page["title"]
-                    self.people_pages[title].image = page["thumbnail"]["source"]
+                    images[title] = page["thumbnail"]["source"]
+                    cached = self.cache.get(title)
+                    if cached is not None:
+                        cached.image = images[title]
+                    if self.store is not None:
+                        self.store.update_image(title, images[title])
+
+        return images
 
     def _extract_links(self, title):
-        session = requests.Session()
         params = {
             "action": "query",
             "format": "json",
-            "titles": title,
             "prop": "links",
             "pllimit": "max",
         }
 
-        data = session.get(url=self.url, params=params).json()
-        pages = data["query"]["pages"]
-
         links = set()
 
-        for val in pages.values():
-            if "links" not in val:
-                return []
-            for link in val["links"]:
-                links.add(link["title"])
-
-        while "continue" in data:
-            plcontinue = data["continue"]["plcontinue"]
-            params["plcontinue"] = plcontinue
-
-            data = session.get(url=self.url, params=params).json()
-            pages = data["query"]["pages"]
-
-            for val in pages.values():
-                for link in val["links"]:
+        for data in self.fetcher.query(self.url, params, [title]):
+            for val in data["query"]["pages"].values():
+                for link in val.get("links", []):
                     links.add(link["title"])
 
         return links
@@ -211,22 +356,19 @@ class Wiki:
     def _extract_categories(self, titles):
         if not isinstance(titles, list):
             titles = [titles]
+        categories = {}
+        params = {
+            "action": "query",
+            "format": "json",
+            "prop": "categories",
+            "cllimit": "max",
+        }
 
-        sidebars = {}
-        step = 50
-
-        for i in range(0, len(titles), step):
-            params = {
-                "action": "query",
-                "format": "json",
-                "prop": "categories",
-                "titles": "|".join(titles),
-            }
-            data = requests.get(self.url, params=params).json()
-            pages = data["query"]["pages"]
-
-            for j, page in enumerate(pages.values()):
-                if "revisions" in page:
-                    sidebars[titles[i + j]] = page["revisions"][0]["slots"]["main"]["*"]
+        for data in self.fetcher.query(self.url, params, titles):
+            for page in data["query"]["pages"].values():
+                if "categories" in page:
+                    categories.setdefault(page["title"], []).extend(
+                        category["title"] for category in page["categories"]
+                    )
 
-        return sidebars
+        return categories